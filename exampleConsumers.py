@@ -14,7 +14,7 @@ def obligConsumer(BM, cId):
         (i.e. data acquisition is halted when no data is requested)
 
       Args:  
-        BM:   Buffer Manager instance
+        BM:   Buffer Manager instance or client handle (BM.BMgetClient())
         cId:  Buffer Manager client id (from main process)
     
   '''
@@ -18,7 +18,7 @@ from mpPulseDisplay import *
 filtRateQ = None
 histQ = None
 filtRateQ = mp.Queue(1) # information queue for Filter
-procs.append(mp.Process(name='RMeter',
+procs.append(BMan.ConsumerProcess(name='RMeter',
           target = mpRMeter, 
           args=(filtRateQ, 12., 2500., 'muon rate history') ) )
 #               mp.Queue  rate  update interval          
@@ -31,7 +31,7 @@ Hdescriptors.append([0., 0.4, 50, 20., 'noise Trg. Pulse (V)', 0] )
 Hdescriptors.append([0., 0.8, 50, 15., 'valid Trg. Pulse (V)', 0] )
 Hdescriptors.append([0., 0.8, 50, 15., 'Pulse height (V)', 0] )
 Hdescriptors.append([0., 15., 45, 7.5, 'Tau (µs)', 1] )
-procs.append(mp.Process(name='Hists',
+procs.append(BMan.ConsumerProcess(name='Hists',
           target = mpHists, 
           args=(histQ, Hdescriptors, 2000., 'Filter Histograms') ) )
 #             data Queue, Hist.Desrc  interval    
@@ -39,13 +39,13 @@ procs.append(mp.Process(name='Hists',
 VSigQ = mp.Queue(1) # information queue for Filter
 mode = 2 # 0:signed, 1: abs. 2: symmetric
 size = 1. # stretch factor for display
-procs.append(mp.Process(name = 'ChannelSignals',
+procs.append(BMan.ConsumerProcess(name = 'ChannelSignals',
           target = mpBDisplay, 
           args=(VSigQ, PSconf, mode, size, 'Panel Signals') ) )
 #               mp.Queue Chan.Conf.           name          
 
 PulseQ = mp.Queue(1)
-procs.append(mp.Process(name = 'PulseDisplay', target = mpPulseDisplay, args=(PulseQ,PSconf)))
+procs.append(BMan.ConsumerProcess(name = 'PulseDisplay', target = mpPulseDisplay, args=(PulseQ,PSconf)))
 
 
 
@@ -58,7 +58,7 @@ cId_pf = BM.BMregister() # get a Buffer Manager Client Id
 #                      BMclientId  RMeterQ  histQ  fileout verbose    
 
   # pulse analysis as sub-process
-procs.append(mp.Process(name='pulseFilterd', target=pulseFilterd, 
+procs.append(BMan.ConsumerProcess(name='pulseFilterd', target=pulseFilterd, 
        args = ( BM, PSconf, cId_pf, filtRateQ, histQ, VSigQ, True, 2, PulseQ) ) )
 #                      BMclientId  RMeterQ  histQ  fileout verbose    
 
@@ -4,6 +4,15 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 import sys, numpy as np, time, traceback as trace
 
+from picodaqa.eventFilter import EventFilter
+from picodaqa.BMlogger import DEBUG
+
+# coincidence of pulses on channels B and C, register with
+#   BM.BMregister(evFilter=coincidenceFilter) to have rejected events
+#   skipped by the Buffer Manager
+coincidenceFilter = EventFilter().require(1, 251, below=-0.04)\
+                                 .require(2, 251, above=-0.01)
+
 def mpProcessPulse(BM, conf, cId):
     '''effective Voltage of data passed via multiprocessing.Queue
         Args:
@@ -36,8 +45,8 @@ def mpProcessPulse(BM, conf, cId):
 #            s=str(evData) + "\n"
 #            logfile.write(s)
 #            logfile.close()
-            if ((evData[1,251] < -0.04) and (evData[2,251] > -0.01)):
-                print("mpProcessPulse: Accepting pulse %i in coincidence filter with A: %.3f B: %.3f C: %.3f"%(evNr, evData[0,251], evData[1,251], evData[2,251]))
+            if coincidenceFilter.accept(evData):
+                prlog("mpProcessPulse: Accepting pulse %i in coincidence filter with A: %.3f B: %.3f C: %.3f"%(evNr, evData[0,251], evData[1,251], evData[2,251]))
 #                filename="pulselog_" + time.strftime("%Y-%m-%dT%H-%M-%S",time.gmtime()) + "-" + str(evNr)
 #                pulsefile=open(filename, "w")
 #                s="#cnt: " + str(cnt) + "\n#evNr: " +str(evNr) + "\n#evTime: " + str(evTime) + "\n"
@@ -47,7 +56,7 @@ def mpProcessPulse(BM, conf, cId):
 #                pulsefile.close()
                 
             else:
-                print("mpProcessPulse: Rejecting pulse %i in coincidence filter with A: %.3f B: %.3f C: %.3f"%(evNr, evData[0,251], evData[1,251], evData[2,251]))
+                prlog("mpProcessPulse: Rejecting pulse %i in coincidence filter with A: %.3f B: %.3f C: %.3f"%(evNr, evData[0,251], evData[1,251], evData[2,251]), DEBUG)
 #                filename="rejectlog_" + time.strftime("%Y-%m-%dT%H-%M-%S",time.gmtime()) + "-" + str(evNr)
 #                rejectfile=open(filename, "w")
 #                s="#cnt: " + str(cnt) + "\n#evNr: " +str(evNr) + "\n#evTime: " + str(evTime) + "\n"
@@ -1,15 +1,20 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-import time, numpy as np, math
+import time, io, numpy as np
 from scipy.signal import argrelmax
-from scipy.interpolate import interp1d
+
+from picodaqa.consumerGroup import OrderedCollector
+from picodaqa.BMlogger import DEBUG
+
+from .TemplateBank import TemplateBank, trapezoidPulse, myonicPulse, parabolicPeaks, constantFractionTimes
 
 
 class PulseProcessor:
 
     def __init__(self, bufferManager, config, consumerId, filterRateQueue=None, histogramQueue=None,
                  voltageSignalQueue=None, pulseDisplayQueue=None, consumerMode=0, logPulses=False,
-                 verbosity=1):
+                 verbosity=1, templateCache=None, templateShapes=None, timingMethod='parabolic',
+                 cfdFraction=0.3, noiseSigmas=None, resultQueue=None):
         self.bufferManager = bufferManager
         self.config = config
         self.consumerId = consumerId
@@ -19,11 +24,17 @@ class PulseProcessor:
         self.histogramQueue = histogramQueue
         self.voltageSignalQueue = voltageSignalQueue
         self.pulseDisplayQueue = pulseDisplayQueue
+        # worker of a consumer group: results of each event are sent to resultQueue
+        #   and merged in event order by mpPulseCollector() instead of being published here
+        self.resultQueue = resultQueue
 
         self.logPulses = logPulses
         self.verbosity = verbosity
 
-        if self.logPulses:
+        if self.logPulses and self.resultQueue is not None:
+            self.pulseFilterLog = io.StringIO()
+            self.doublePulseFilterLog = io.StringIO()
+        elif self.logPulses:
             datetime = time.strftime('%y%m%d-%H%M', time.gmtime())
             self.pulseFilterLog = open('pulseLogs/pFilt_' + datetime + '.dat', 'w')
             print("# EvNr, EvT, Vs ...., Ts ...T",
@@ -42,6 +53,13 @@ class PulseProcessor:
                 self.triggerChannel = i
                 break
         self.triggerSampleIndex = int(self.config.NSamples * self.config.pretrig)  # sample number of trigger point
+        # sub-sample pulse timing: 'parabolic' (peak of correlation), 'cfd' (constant fraction
+        #   of pulse height on leading edge) or None (time of sample)
+        self.timingMethod = timingMethod
+        self.cfdFraction = cfdFraction
+        # adaptive thresholds: correlation above noiseSigmas times its noise, from the running
+        #   baseline and noise RMS of the Buffer Manager; None: fixed thresholds (template norms)
+        self.noiseSigmas = noiseSigmas
 
         # set characteristics of reference pulse for convoultion pulse search
         #     unipolar pulse:
@@ -51,16 +69,21 @@ class PulseProcessor:
         # pulseHeight = -0.030  # pulse height (V) (SiPM panels)
         self.pulseHeight = -0.035  # pulse height (V) (Kamiokanne)
 
-        self.referencePulse = self.generateReferencePulse(self.dT, self.tauRise, self.tauOn, self.tauFall, self.pulseHeight)
+        # reference pulses, mean-subtracted versions and thresholds (norms) for correlation analysis,
+        #   precomputed and cached per configuration in directory templateCache (None: no cache);
+        #   several pulse shapes (e.g. SiPM panels and Kamiokanne) may be given in templateShapes,
+        #   each pulse is assigned the best matching shape
+        if templateShapes is None:
+            templateShapes = [{'name': 'myonic', 'shape': 'myonic', 'tauRise': self.tauRise,
+                               'tauOn': self.tauOn, 'tauFall': self.tauFall, 'pulseHeight': self.pulseHeight}]
+        self.templateBank = TemplateBank(self.dT, self.config.NSamples, templateShapes, templateCache)
+        self.referencePulse = self.templateBank.template(0)
         self.displayPulse(3, self.referencePulse)
 
-        self.referencePulseLength = len(self.referencePulse)
-        self.zeroNormalizedReferencePulse = self.referencePulse - self.referencePulse.mean()  # mean subtracted
-
-        # calculate thresholds for correlation analysis
-        self.pulseThreshold = np.sum(self.referencePulse * self.referencePulse)  # norm of reference pulse
-        self.zeroNormalizedPulseThreshold = np.sum(
-            self.zeroNormalizedReferencePulse * self.zeroNormalizedReferencePulse)  # norm of mean-subtracted reference pulse
+        self.referencePulseLength = self.templateBank.L  # longest template
+        self.zeroNormalizedReferencePulse = self.templateBank.zeroNormalizedTemplate(0)
+        self.pulseThreshold = self.templateBank.pulseThresholds[0]
+        self.zeroNormalizedPulseThreshold = self.templateBank.zeroNormalizedThresholds[0]
         if self.verbosity > 1:
             self.bufferManager.prlog('*==* pulse Filter: reference pulse')
             self.bufferManager.prlog(np.array_str(self.referencePulse))
@@ -73,64 +96,29 @@ class PulseProcessor:
         self.doubleCoincidenceCount = 0
         self.tripleCoincidenceCount = 0
         self.doublePulseCount = 0
+        self.templateCounts = np.zeros((self.nChannels, self.templateBank.K), dtype=np.int32)  # pulses per template
 
         # arrays for quantities to be histogrammed
         self.noiseTriggerSignals = []  # pulse height of noise signals
         self.validTriggerSignals = []  # pulse height of valid triggers
         self.voltageSignals = []  # pulse heights non-triggering channels
         self.doublePulseTaus = []  # deltaT of double pulses
+        self.lastPulseVoltages = None  # pulse heights of last accepted event
+        self.publishedCounts = np.zeros(6, dtype=np.int64)  # counters sent to resultQueue
 
     def generateTrapezoidPulse(self, timeScale, riseTime, onTime, fallTime, fallTime2=0, offTime=0., riseTime2=0.,
                                mode=0):
         '''
-          create a single or double trapezoidal plulse,
-            normalised to pulse height one
-               ______
-              /      \
-           _ /_ _ _ _ \_ _ _ _ _ _ _
-                       \__________/
-            r    on  f f2   off  r2
-
-          Args:
-           rise time,
-           on time,
-           fall time
-           off-time  for bipolar pulse
-           fall time for bipolar pulse
-           mode: 0 single unipolar, 1: double bipolar
+          create a single or double trapezoidal plulse, normalised to pulse height one,
+            see TemplateBank.trapezoidPulse()
         '''
-        ti = [0., riseTime, riseTime + onTime, riseTime + onTime + fallTime]
-        ri = [0., 1., 1., 0.]
-        if mode:  # for bipolar pulse
-            # normalize neg. pulse to same integral as positive part
-            voltageOff = -(0.5 * (riseTime + fallTime) + onTime) / (0.5 * (fallTime2 + riseTime2) + offTime)
-            ti = ti.append(riseTime + onTime + fallTime + fallTime2)
-            ri = ri.append(voltageOff)
-            ti = ti.append(riseTime + onTime + fallTime + fallTime2 + offTime)
-            ri = ri.append(voltageOff)
-            ti = ti.append(riseTime + onTime + fallTime + fallTime2 + offTime + riseTime2)
-            ri = ri.append(0.)
-
-        trapezoidInterpolator = interp1d(ti, ri, kind='linear', copy=False, assume_sorted=True)
-
-        return trapezoidInterpolator(timeScale)
+        return trapezoidPulse(timeScale, riseTime, onTime, fallTime, fallTime2, offTime, riseTime2, mode)
 
     def generateMyonicPulse(self, timeScale, riseTime, onTime, lifeTime):
         """
-            create a single pulse that looks right
-        :param timeScale:
-        :param riseTime:
-        :param onTime:
-        :param fallTime:
-        :return:
+            create a single pulse that looks right, see TemplateBank.myonicPulse()
         """
-
-        ti = [0., riseTime, riseTime + onTime, riseTime + onTime + lifeTime, riseTime + onTime + 2 * lifeTime,
-              riseTime + onTime + 3 * lifeTime, riseTime + onTime + 4 * lifeTime, riseTime + onTime + 5 * lifeTime, riseTime + onTime + 6 * lifeTime]
-        ri = [0., 1., 1., math.exp(-1), math.exp(-2), math.exp(-3), math.exp(-4), math.exp(-5), math.exp(-6)]
-        myonicInterpolator = interp1d(ti,ri, kind='linear', copy=False, assume_sorted=True)
-
-        return myonicInterpolator(timeScale)
+        return myonicPulse(timeScale, riseTime, onTime, lifeTime)
 
     def generateReferencePulse(self, dT, tauRise=20E-9, tauOn=12E-9, tauFall=128E-9, pulseHeight=-0.030):
         '''
@@ -150,9 +138,9 @@ class PulseProcessor:
 
     def displayPulse(self, id, pulse):
         if self.putQueue(self.pulseDisplayQueue, (id, pulse)):
-            print("displayPulse: Displayed pulse")
+            self.bufferManager.prlog("displayPulse: Displayed pulse", DEBUG)
         else:
-            print("displayPulse: Dropped pulse")
+            self.bufferManager.prlog("displayPulse: Dropped pulse", DEBUG)
 
     def putQueue(self, queue, obj):
         if queue is not None and queue.empty():
@@ -173,6 +161,40 @@ class PulseProcessor:
         self.close()
 
     def process(self, event):
+        '''analyse event, in worker mode send results to resultQueue'''
+        self.lastPulseVoltages = None
+        accepted = self.analyseEvent(event)
+        if self.resultQueue is not None:
+            self.publishResult(event[0], event[1])
+
+        return accepted
+
+    def publishResult(self, eventNumber, eventTime):
+        '''
+          send increments of counters, histogram entries, pulse heights and log lines
+          of the last event to resultQueue
+        '''
+        counts = np.array([self.eventCount, self.validCount, self.coincidenceCount,
+                           self.doubleCoincidenceCount, self.tripleCoincidenceCount, self.doublePulseCount])
+        result = {'eventTime': eventTime,
+                  'counts': counts - self.publishedCounts,
+                  'histograms': [self.noiseTriggerSignals, self.validTriggerSignals,
+                                 self.voltageSignals, self.doublePulseTaus],
+                  'voltages': self.lastPulseVoltages,
+                  'pFilt': '', 'dpFilt': ''}
+        self.publishedCounts = counts
+        self.noiseTriggerSignals = []
+        self.validTriggerSignals = []
+        self.voltageSignals = []
+        self.doublePulseTaus = []
+        if self.logPulses:
+            for key, log in (('pFilt', self.pulseFilterLog), ('dpFilt', self.doublePulseFilterLog)):
+                result[key] = log.getvalue()
+                log.seek(0)
+                log.truncate()
+        self.resultQueue.put((int(eventNumber), result))
+
+    def analyseEvent(self, event):
         '''
           Find a pulse similar to a template pulse by cross-correlatation
 
@@ -199,6 +221,18 @@ class PulseProcessor:
         pulseVoltages = [[0.] for i in range(self.nChannels)]
         pulseTimes = [[0.] for i in range(self.nChannels)]
 
+        # correlation of all channels with all templates, and best match at each position
+        self.baselines = self.bufferManager.baseline  # running baseline per channel
+        if self.noiseSigmas is not None:
+            thresholds = self.templateBank.noiseThresholds(np.sqrt(self.bufferManager.noiseVariance),
+                                                          self.noiseSigmas)
+            correlations = self.templateBank.correlate(eventData - self.baselines[:, None])
+            self.matchScores, self.matchTemplates, self.matchCorrelations = \
+                self.templateBank.bestMatch(correlations, thresholds)
+        else:
+            self.matchScores, self.matchTemplates, self.matchCorrelations = \
+                self.templateBank.bestMatch(self.templateBank.correlate(eventData))
+
         validated, firstPeak, firstPeakVoltage = self.validateTriggerPulse(eventData)
         if self.triggerChannel >= 0 and validated is False:
             self.noiseTriggerSignals.append(firstPeakVoltage)
@@ -208,7 +242,7 @@ class PulseProcessor:
         self.validCount += 1
         pulseVoltages[self.triggerChannel][0] = firstPeakVoltage
         self.validTriggerSignals.append(firstPeakVoltage)
-        firstPeakTime = firstPeak * self.dT * 1E6
+        firstPeakTime = self.pulseTimes(eventData, [self.triggerChannel], [firstPeak])[0]
         pulseTimes[self.triggerChannel][0] = firstPeakTime
 
         coincidenceCount, coincidenceVoltages, coincidenceTimes = self.findCoincidences(eventData, firstPeak)
@@ -227,9 +261,9 @@ class PulseProcessor:
         if self.nChannels == 1 or (self.nChannels > 1 and coincidenceCount >= 2):
             accepted = True
             self.coincidenceCount += 1
-            print("PulseProcessor: Accepted event")
+            self.bufferManager.prlog("PulseProcessor: Accepted event", DEBUG)
         else:
-            print("PulseProcessor: Did not accept event")
+            self.bufferManager.prlog("PulseProcessor: Did not accept event", DEBUG)
 
             return False
 
@@ -333,12 +367,15 @@ class PulseProcessor:
             self.voltageSignals = []
             self.doublePulseTaus = []
         # provide information necessary for Panel Display
-        self.putQueue(self.voltageSignalQueue, [pulseVoltages[c][0] for c in range(self.nChannels)])
+        self.lastPulseVoltages = [pulseVoltages[c][0] for c in range(self.nChannels)]
+        self.putQueue(self.voltageSignalQueue, self.lastPulseVoltages)
 
         return True
 
     def close(self):
-        if self.logPulses:
+        if self.resultQueue is not None:
+            self.resultQueue.put(None)  # end of worker
+        elif self.logPulses:
             if self.pulseFilterLog:
                 print("# PulseProcessor Summary: last evNR %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i" % (
                     self.eventCount,
@@ -358,25 +395,56 @@ class PulseProcessor:
                 ), file=self.doublePulseFilterLog)
                 print("#                      %i double pulses" % self.doublePulseCount, file=self.doublePulseFilterLog)
                 self.doublePulseFilterLog.close()
+        if self.templateBank.K > 1:
+            for k, name in enumerate(self.templateBank.names):
+                self.bufferManager.prlog('*==* PulseProcessor: %s pulses per channel: %s' % (
+                    name, ", ".join(["%i" % n for n in self.templateCounts[:, k]])))
+
+    def pulseTimes(self, eventData, channels, peaks):
+        '''
+          times in us of pulses starting at samples peaks on channels,
+          refined to sub-sample precision for all candidates at once
+        '''
+        if self.timingMethod == 'parabolic':
+            positions = parabolicPeaks(self.matchCorrelations, peaks, channels)
+        elif self.timingMethod == 'cfd':
+            positions = constantFractionTimes(eventData, (channels, peaks), self.referencePulseLength,
+                                              self.baselines, self.cfdFraction)
+        else:
+            positions = np.asarray(peaks, dtype=np.float64)
+        return positions * self.dT * 1E6
+
+    def findPeak(self, channel, start, stop):
+        '''
+          position and template of best match above threshold in window
+          starts [start, stop); start if no template exceeds its threshold
+        '''
+        accepted = self.matchScores[channel, start:stop] > 1.
+        if accepted.any():
+            peak = np.argmax(np.where(accepted, self.matchCorrelations[channel, start:stop], -np.inf)) + start
+        else:
+            peak = start
+        return peak, self.matchTemplates[channel, min(peak, self.matchTemplates.shape[1] - 1)]
+
+    def checkShape(self, pulseEventData, template):
+        '''check pulse shape by requesting match with mean-subtracted template'''
+        return self.templateBank.shapeScore(pulseEventData, template) > \
+            self.templateBank.zeroNormalizedThresholds[template]
 
     def validateTriggerPulse(self, eventData):
         offset = max(0, self.triggerSampleIndex - int(self.tauRise / self.dT) - self.sampleOffset)
-        cort = np.correlate(
-            eventData[self.triggerChannel, 0:self.triggerSampleIndex + self.sampleOffset + self.referencePulseLength],
-            self.referencePulse, mode='valid')
-        cort[cort < self.pulseThreshold] = self.pulseThreshold  # set all values below threshold to threshold
-        firstPeak = np.argmax(cort) + offset  # index of 1st maximum
-        print("firstPeak: %i offset: %i" % (firstPeak, offset))
+        firstPeak, template = self.findPeak(self.triggerChannel, offset, self.triggerSampleIndex + self.sampleOffset + 1)
+        self.bufferManager.prlog("firstPeak: %i offset: %i" % (firstPeak, offset), DEBUG, 'firstPeak')
         if firstPeak > self.triggerSampleIndex + (self.tauRise + self.tauOn) / self.dT + self.sampleOffset:
             self.displayPulse(0, eventData[self.triggerChannel,
                               0:self.triggerSampleIndex + self.sampleOffset + self.referencePulseLength])
 
             return False, None, 0.  # - while # no pulse near trigger, skip rest of event analysis
         # check pulse shape by requesting match with time-averaged pulse
-        eventDataFirstPulse = eventData[self.triggerChannel, firstPeak:firstPeak + self.referencePulseLength]
-        if np.sum((eventDataFirstPulse - eventDataFirstPulse.mean()) * self.zeroNormalizedReferencePulse) \
-                > self.zeroNormalizedPulseThreshold:
+        eventDataFirstPulse = eventData[self.triggerChannel, firstPeak:firstPeak + self.templateBank.lengths[template]]
+        if self.checkShape(eventDataFirstPulse, template):
             self.displayPulse(2, eventData[self.triggerChannel, firstPeak:firstPeak + self.referencePulseLength])
+            self.templateCounts[self.triggerChannel, template] += 1
 
             return True, firstPeak, max(abs(eventDataFirstPulse))
         else:
@@ -388,25 +456,27 @@ class PulseProcessor:
         coincidenceCount = 1
         coincidenceTimes = [0. for i in range(self.nChannels)]
         coincidenceVoltages = [0. for i in range(self.nChannels)]
+        coincidenceChannels = []
+        coincidencePeaks = []
         for channel in range(self.nChannels):
             if channel != self.triggerChannel:
                 # search around trigger pulse
                 offset = max(0, peak - self.sampleOffset)
                 # analyse channel to find pulse near trigger
-                correlation = np.correlate(
-                    eventData[channel, offset:self.triggerSampleIndex + self.sampleOffset + self.referencePulseLength],
-                    self.referencePulse, mode='valid')
-                correlation[correlation < self.pulseThreshold] = self.pulseThreshold
-                coincidencePeak = np.argmax(correlation) + offset
+                coincidencePeak, template = self.findPeak(channel, offset, self.triggerSampleIndex + self.sampleOffset + 1)
                 if coincidencePeak > self.triggerSampleIndex + (self.tauRise + self.tauOn) / self.dT + self.sampleOffset:
                     continue
-                coincidenceEventData = eventData[channel, coincidencePeak:coincidencePeak + self.referencePulseLength]
-                if np.sum((coincidenceEventData - coincidenceEventData.mean()) * self.zeroNormalizedReferencePulse) \
-                        > self.zeroNormalizedPulseThreshold:
+                coincidenceEventData = eventData[channel, coincidencePeak:coincidencePeak + self.templateBank.lengths[template]]
+                if self.checkShape(coincidenceEventData, template):
                     coincidenceCount += 1
-                    self.bufferManager.prlog("PulseProcessor: Coincidence in channel %i" % (channel))
+                    self.templateCounts[channel, template] += 1
+                    self.bufferManager.prlog("PulseProcessor: Coincidence in channel %i, %s pulse" %
+                                             (channel, self.templateBank.names[template]))
                     coincidenceVoltages[channel] = max(abs(coincidenceEventData))
-                    coincidenceTimes[channel] = coincidencePeak * self.dT * 1E6
+                    coincidenceChannels.append(channel)
+                    coincidencePeaks.append(coincidencePeak)
+        for channel, t in zip(coincidenceChannels, self.pulseTimes(eventData, coincidenceChannels, coincidencePeaks)):
+            coincidenceTimes[channel] = t
 
         return coincidenceCount, coincidenceVoltages, coincidenceTimes
 
@@ -415,15 +485,70 @@ class PulseProcessor:
         doublePulseCount = [0 for i in range(self.nChannels)]
         doublePulseVoltages = [[] for i in range(self.nChannels)]
         doublePulseTimes = [[] for i in range(self.nChannels)]
+        doublePulseChannels = []
+        doublePulsePeaks = []
         for channel in range(self.nChannels):
-            correlation = np.correlate(eventData[channel, offset:], self.referencePulse, mode='valid')
-            correlation[correlation < self.pulseThreshold] = self.pulseThreshold
-            for pulseIndex in (argrelmax(correlation)[0] + offset):
-                pulseEventData = eventData[channel, pulseIndex:pulseIndex + self.referencePulseLength]
-                if np.sum((pulseEventData - pulseEventData.mean()) * self.zeroNormalizedReferencePulse) \
-                        > self.zeroNormalizedPulseThreshold:
+            correlations = self.matchCorrelations[channel, offset:].copy()
+            correlations[self.matchScores[channel, offset:] < 1.] = -np.inf  # below threshold
+            for pulseIndex in (argrelmax(correlations)[0] + offset):
+                template = self.matchTemplates[channel, pulseIndex]
+                pulseEventData = eventData[channel, pulseIndex:pulseIndex + self.templateBank.lengths[template]]
+                if self.checkShape(pulseEventData, template):
                     doublePulseCount[channel] += 1
+                    self.templateCounts[channel, template] += 1
                     doublePulseVoltages[channel].append(max(abs(pulseEventData)))
-                    doublePulseTimes[channel].append(pulseIndex * self.dT * 1E6)
+                    doublePulseChannels.append(channel)
+                    doublePulsePeaks.append(pulseIndex)
+        for channel, t in zip(doublePulseChannels, self.pulseTimes(eventData, doublePulseChannels, doublePulsePeaks)):
+            doublePulseTimes[channel].append(t)
 
         return doublePulseCount, doublePulseVoltages, doublePulseTimes
+
+
+def mpPulseCollector(resultQueue, NWorkers, filterRateQueue=None, histogramQueue=None,
+                     voltageSignalQueue=None, logPulses=False):
+    '''
+      merge results of PulseProcessor workers of a consumer group in event order;
+      sums up counters, publishes to RateMeter, histograms and Panel Display and
+      writes the pulse logs as a single PulseProcessor would; runs as sub-process
+    '''
+    def putQueue(queue, obj):
+        if queue is not None and queue.empty():
+            queue.put(obj)
+            return True
+        return False
+
+    if logPulses:
+        datetime = time.strftime('%y%m%d-%H%M', time.gmtime())
+        pulseFilterLog = open('pulseLogs/pFilt_' + datetime + '.dat', 'w')
+        print("# EvNr, EvT, Vs ...., Ts ...T", file=pulseFilterLog)  # header line
+        doublePulseFilterLog = open('pulseLogs/dpFilt_' + datetime + '.dat', 'w', 1)
+        print("# Nacc, Ndble, Tau, delT(iChan), ... V(iChan)", file=doublePulseFilterLog)  # header line
+
+    counts = np.zeros(6, dtype=np.int64)  # Nev, Nval, Nacc, Nacc2, Nacc3, Ndble
+    histograms = [[], [], [], []]
+    collector = OrderedCollector(resultQueue, NWorkers)
+    for eventNumber, result in collector:
+        counts += result['counts']
+        for h, entries in zip(histograms, result['histograms']):
+            h.extend(entries)
+        if logPulses:
+            pulseFilterLog.write(result['pFilt'])
+            # counters in double pulse log refer to all workers
+            for line in result['dpFilt'].splitlines():
+                print("%i, %i, %s" % (counts[2], counts[5], line.split(', ', 2)[2]), file=doublePulseFilterLog)
+
+        putQueue(filterRateQueue, (counts[2], result['eventTime']))
+        if len(histograms[1]) and putQueue(histogramQueue, histograms):
+            histograms = [[], [], [], []]
+        if result['voltages'] is not None:
+            putQueue(voltageSignalQueue, result['voltages'])
+
+    summary = "# PulseProcessor Summary: last evNR %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i" % tuple(counts[:5])
+    if logPulses:
+        print(summary, file=pulseFilterLog)
+        pulseFilterLog.close()
+        print(summary, file=doublePulseFilterLog)
+        print("#                      %i double pulses" % counts[5], file=doublePulseFilterLog)
+        doublePulseFilterLog.close()
+    print('*==* mpPulseCollector: %i workers, %i events, %i missing' % (NWorkers, counts[0], collector.Nmissing))
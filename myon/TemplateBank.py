@@ -0,0 +1,309 @@
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os, math, hashlib, numpy as np
+from scipy.interpolate import interp1d
+
+# increase if content or layout of cached arrays changes
+cacheVersion = 1
+
+defaultShapes = [
+    # unipolar pulse as used by PulseProcessor (Kamiokanne)
+    {'name': 'myonic', 'shape': 'myonic', 'tauRise': 20E-9, 'tauOn': 12E-9,
+     'tauFall': 128E-9, 'pulseHeight': -0.035}]
+
+
+def trapezoidPulse(timeScale, riseTime, onTime, fallTime, fallTime2=0., offTime=0., riseTime2=0., mode=0):
+    '''
+      create a single or double trapezoidal plulse,
+        normalised to pulse height one
+           ______
+          /      \
+       _ /_ _ _ _ \_ _ _ _ _ _ _
+                   \__________/
+        r    on  f f2   off  r2
+
+      Args:
+       rise time,
+       on time,
+       fall time
+       off-time  for bipolar pulse
+       fall time for bipolar pulse
+       mode: 0 single unipolar, 1: double bipolar
+    '''
+    ti = [0., riseTime, riseTime + onTime, riseTime + onTime + fallTime]
+    ri = [0., 1., 1., 0.]
+    if mode:  # for bipolar pulse
+        # normalize neg. pulse to same integral as positive part
+        voltageOff = -(0.5 * (riseTime + fallTime) + onTime) / (0.5 * (fallTime2 + riseTime2) + offTime)
+        ti += [ti[-1] + fallTime2, ti[-1] + fallTime2 + offTime, ti[-1] + fallTime2 + offTime + riseTime2]
+        ri += [voltageOff, voltageOff, 0.]
+
+    trapezoidInterpolator = interp1d(ti, ri, kind='linear', copy=False, assume_sorted=True,
+                                     bounds_error=False, fill_value=0.)
+    return trapezoidInterpolator(timeScale)
+
+
+def myonicPulse(timeScale, riseTime, onTime, lifeTime):
+    '''
+      create a single pulse with exponential decay, normalised to pulse height one
+    '''
+    ti = [0., riseTime] + [riseTime + onTime + i * lifeTime for i in range(7)]
+    ri = [0., 1.] + [math.exp(-i) for i in range(7)]
+    myonicInterpolator = interp1d(ti, ri, kind='linear', copy=False, assume_sorted=True,
+                                  bounds_error=False, fill_value=0.)
+    return myonicInterpolator(timeScale)
+
+
+def generatePulse(dT, shape):
+    '''
+      sampled pulse for one entry of the shape list of TemplateBank
+
+      shape keys: shape ('myonic', 'trapezoid' or 'bipolar'), tauRise, tauOn,
+        tauFall, pulseHeight; for 'bipolar' also tauFall2, tauOff, tauRise2
+    '''
+    tauRise, tauOn, tauFall = shape['tauRise'], shape['tauOn'], shape['tauFall']
+    pulseDuration = tauRise + tauOn + tauFall
+    if shape['shape'] == 'bipolar':
+        pulseDuration += shape['tauFall2'] + shape['tauOff'] + shape['tauRise2']
+    pulseDurationSamples = np.int32(pulseDuration / dT + 0.5) + 1
+    timeScale = np.linspace(0, pulseDuration, pulseDurationSamples)
+    if shape['shape'] == 'myonic':
+        pulse = myonicPulse(timeScale, tauRise, tauOn, 0.3 * tauFall)
+    elif shape['shape'] == 'trapezoid':
+        pulse = trapezoidPulse(timeScale, tauRise, tauOn, tauFall)
+    elif shape['shape'] == 'bipolar':
+        pulse = trapezoidPulse(timeScale, tauRise, tauOn, tauFall,
+                               shape['tauFall2'], shape['tauOff'], shape['tauRise2'], mode=1)
+    else:
+        raise ValueError('TemplateBank: unknown pulse shape ' + str(shape['shape']))
+    return shape['pulseHeight'] * pulse
+
+
+def parabolicPeaks(y, peaks, rows=None):
+    '''
+      sub-sample positions of maxima by a parabola through the maximum and
+      its neighbours, vectorized over all candidates
+
+      Args:
+        y: correlation (M) or (rows, M)
+        peaks: indices of maxima
+        rows: row of each maximum, if y is two-dimensional
+      Returns:
+        positions of maxima, float
+    '''
+    peaks = np.asarray(peaks, dtype=np.int64)
+    if not len(peaks):
+        return np.zeros(0)
+    if rows is not None:
+        y = y[np.asarray(rows)]
+    else:
+        y = np.broadcast_to(y, (len(peaks), y.shape[-1]))
+    inner = np.clip(peaks, 1, y.shape[-1] - 2)  # neighbours must exist
+    i = np.arange(len(peaks))
+    y0, y1, y2 = y[i, inner - 1], y[i, inner], y[i, inner + 1]
+    curvature = y0 - 2. * y1 + y2
+    shift = np.where(curvature < 0., 0.5 * (y0 - y2) / np.where(curvature < 0., curvature, -1.), 0.)
+    shift = np.where(inner == peaks, np.clip(shift, -0.5, 0.5), 0.)
+    return peaks + shift
+
+
+def constantFractionTimes(data, starts, length, baselines, fraction=0.3):
+    '''
+      sub-sample times of constant-fraction crossings on the leading edge,
+      vectorized over all candidates
+
+      Args:
+        data: traces (rows, NSamples)
+        starts: (row, first sample) of each pulse window
+        length: window length
+        baselines: baseline of each row
+        fraction: fraction of pulse height
+      Returns:
+        crossing positions in samples, float
+    '''
+    rows, firsts = (np.asarray(a, dtype=np.int64) for a in starts)
+    if not len(rows):
+        return np.zeros(0)
+    idx = np.minimum(firsts[:, None] + np.arange(length), data.shape[-1] - 1)
+    windows = np.abs(data[rows[:, None], idx] - np.asarray(baselines)[rows][:, None])
+    amplitudes = windows.max(axis=1)
+    above = windows >= fraction * amplitudes[:, None]
+    j = np.maximum(np.argmax(above, axis=1), 1)  # first sample above threshold
+    i = np.arange(len(rows))
+    v0, v1 = windows[i, j - 1], windows[i, j]
+    frac = np.where(v1 > v0, (fraction * amplitudes - v0) / np.where(v1 > v0, v1 - v0, 1.), 0.)
+    return firsts + j - 1 + np.clip(frac, 0., 1.)
+
+
+class TemplateBank:
+    '''
+      reference pulses for the correlation analysis and derived quantities,
+      precomputed for given sampling interval and trace length
+
+        - templates (K, L): K pulse shapes, padded with zeros to common length L
+        - zeroNormalizedTemplates: templates with their mean subtracted
+        - pulseThresholds, zeroNormalizedThresholds: norms of the above
+        - spectra: complex conjugate FFT of the templates, for correlation
+          with traces of NSamples samples
+
+      arrays are cached on disk per configuration (directory cacheDir) and
+      loaded as read-only memory maps, i.e. shared between processes
+    '''
+
+    arrayNames = ['templates', 'lengths', 'zeroNormalizedTemplates', 'pulseThresholds',
+                  'zeroNormalizedThresholds', 'spectra', 'zeroNormalizedSpectra']
+
+    def __init__(self, dT, NSamples, shapes=None, cacheDir=None):
+        '''
+          Args:
+            dT: sampling interval in sec
+            NSamples: number of samples per trace
+            shapes: list of dictionaries, see generatePulse(); default: defaultShapes
+            cacheDir: directory for cached arrays, None: no caching
+        '''
+        self.dT = dT
+        self.NSamples = NSamples
+        self.shapes = shapes if shapes is not None else defaultShapes
+        self.names = [s['name'] if 'name' in s else s['shape'] for s in self.shapes]
+        self.key = self.configurationKey()
+
+        self.cachePath = None
+        if cacheDir is not None:
+            self.cachePath = os.path.join(cacheDir, 'templates_' + self.key)
+        if self.cachePath is None or not self.load():
+            self.compute()
+            if self.cachePath is not None:
+                self.save()
+            if self.cachePath is not None:  # use memory maps also for first process
+                self.load()
+
+        self.K, self.L = self.templates.shape
+        self.nfft = 2 * (self.spectra.shape[1] - 1)
+
+    def configurationKey(self):
+        '''hash of all parameters the precomputed arrays depend on'''
+        items = [cacheVersion, '%.6e' % self.dT, self.NSamples]
+        for s in self.shapes:
+            items.append(sorted((k, '%.6e' % v if isinstance(v, float) else str(v)) for k, v in s.items()))
+        return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()[:16]
+
+    def compute(self):
+        pulses = [generatePulse(self.dT, s) for s in self.shapes]
+        self.lengths = np.array([len(p) for p in pulses], dtype=np.int32)
+        L = self.lengths.max()
+        self.templates = np.zeros((len(pulses), L), dtype=np.float64)
+        self.zeroNormalizedTemplates = np.zeros((len(pulses), L), dtype=np.float64)
+        for k, p in enumerate(pulses):
+            self.templates[k, :len(p)] = p
+            self.zeroNormalizedTemplates[k, :len(p)] = p - p.mean()  # mean subtracted
+        self.pulseThresholds = np.sum(self.templates ** 2, axis=1)
+        self.zeroNormalizedThresholds = np.sum(self.zeroNormalizedTemplates ** 2, axis=1)
+        # FFT length for linear (not circular) correlation with a full trace
+        nfft = 1 << int(math.ceil(math.log(self.NSamples + L - 1, 2)))
+        self.spectra = np.conj(np.fft.rfft(self.templates, nfft, axis=1))
+        self.zeroNormalizedSpectra = np.conj(np.fft.rfft(self.zeroNormalizedTemplates, nfft, axis=1))
+
+    def save(self):
+        try:
+            if not os.path.isdir(self.cachePath):
+                os.makedirs(self.cachePath)
+            # write to temporary names first, concurrent readers see complete files only
+            for name in self.arrayNames:
+                fileName = os.path.join(self.cachePath, name + '.npy')
+                np.save(fileName + '.tmp.npy', getattr(self, name))
+                os.rename(fileName + '.tmp.npy', fileName)
+        except (IOError, OSError) as e:
+            print('TemplateBank: cannot write cache ' + self.cachePath + ': ' + str(e))
+            self.cachePath = None
+
+    def load(self):
+        '''load cached arrays as read-only memory maps, False if not cached'''
+        try:
+            for name in self.arrayNames:
+                setattr(self, name, np.load(os.path.join(self.cachePath, name + '.npy'), mmap_mode='r'))
+        except (IOError, OSError, ValueError):
+            return False
+        return True
+
+    def template(self, k=0):
+        '''reference pulse k, without padding'''
+        return self.templates[k, :self.lengths[k]]
+
+    def zeroNormalizedTemplate(self, k=0):
+        return self.zeroNormalizedTemplates[k, :self.lengths[k]]
+
+    def slidingSums(self, data, k=0):
+        '''sums over all windows of length of template k along last axis of data'''
+        cumulative = np.cumsum(data, axis=-1, dtype=np.float64)
+        cumulative = np.concatenate((np.zeros(cumulative.shape[:-1] + (1,)), cumulative), axis=-1)
+        l = self.lengths[k]
+        return cumulative[..., l:] - cumulative[..., :-l]
+
+    def slidingMeans(self, data, k=0):
+        '''means over all windows of length of template k along last axis of data'''
+        return self.slidingSums(data, k) / self.lengths[k]
+
+    def shapeScore(self, data, k=0):
+        '''
+          correlation of data window with mean-subtracted template k;
+          as the mean-subtracted template sums to zero, subtraction of
+          the window mean is not needed; a template cut at the end of
+          the trace is centred again
+        '''
+        l = min(self.lengths[k], data.shape[-1])  # window may be cut at end of trace
+        template = self.zeroNormalizedTemplates[k, :l]
+        if l < self.lengths[k]:
+            template = template - template.mean()
+        return np.dot(data[..., :l], template)
+
+    def correlate(self, data, zeroNormalized=False):
+        '''
+          correlation of traces with all K templates in one pass (FFT)
+
+          Args:
+            data: traces (..., NSamples)
+            zeroNormalized: use mean-subtracted templates
+          Returns:
+            correlations (..., K, NSamples - L + 1); entry i corresponds
+            to the window starting at sample i, as np.correlate(mode='valid')
+        '''
+        spectra = self.zeroNormalizedSpectra if zeroNormalized else self.spectra
+        dataSpectra = np.fft.rfft(data, self.nfft, axis=-1)
+        correlations = np.fft.irfft(dataSpectra[..., None, :] * spectra, self.nfft, axis=-1)
+        return correlations[..., :data.shape[-1] - self.L + 1]
+
+    def noiseThresholds(self, noiseRMS, Nsigma):
+        '''
+          correlation thresholds (..., K) at Nsigma times the noise of the
+          correlation, for noise RMS (...) of the traces
+        '''
+        return Nsigma * np.asarray(noiseRMS)[..., None] * np.sqrt(self.pulseThresholds)
+
+    def bestMatch(self, correlations, thresholds=None):
+        '''
+          best matching template at each position, i.e. largest correlation
+          normalised to the norm of the template, independent of its height;
+          among templates of equal shape (same normalised correlation) the
+          one with height closest to the fitted pulse height
+
+          Args:
+            correlations: (..., K, M) as returned by correlate()
+            thresholds: (..., K) correlation thresholds, default: norms of templates
+          Returns:
+            score: correlation of best template relative to its threshold,
+                   for the default i.e. fitted pulse height relative to
+                   template pulse height
+            best: index of best template
+            match: normalised correlation of best template, comparable
+                   between templates, e.g. to locate pulses
+        '''
+        if thresholds is None:
+            thresholds = self.pulseThresholds
+        normalized = correlations / np.sqrt(self.pulseThresholds)[:, None]
+        top = normalized.max(axis=-2, keepdims=True)
+        candidates = normalized >= top - 1E-9 * np.abs(top)
+        heightMismatch = np.abs(correlations / self.pulseThresholds[:, None] - 1.)
+        best = np.argmin(np.where(candidates, heightMismatch, np.inf), axis=-2)
+        scores = correlations / np.broadcast_to(np.asarray(thresholds)[..., None], correlations.shape)
+        return (np.take_along_axis(scores, best[..., None, :], axis=-2)[..., 0, :], best,
+                np.take_along_axis(normalized, best[..., None, :], axis=-2)[..., 0, :])
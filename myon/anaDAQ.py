@@ -18,7 +18,7 @@ from myon import mpPulseDisplay
 filtRateQ = None
 histQ = None
 filtRateQ = mp.Queue(1) # information queue for Filter
-procs.append(mp.Process(name='RMeter',
+procs.append(BMan.ConsumerProcess(name='RMeter',
           target = mpRMeter, 
           args=(filtRateQ, 12., 2500., 'muon rate history') ) )
 #               mp.Queue  rate  update interval          
@@ -31,7 +31,7 @@ Hdescriptors.append([0., 0.4, 50, 20., 'noise Trg. Pulse (V)', 0] )
 Hdescriptors.append([0., 0.8, 50, 15., 'valid Trg. Pulse (V)', 0] )
 Hdescriptors.append([0., 0.8, 50, 15., 'Pulse height (V)', 0] )
 Hdescriptors.append([0., 15., 45, 7.5, 'Tau (µs)', 1] )
-procs.append(mp.Process(name='Hists',
+procs.append(BMan.ConsumerProcess(name='Hists',
           target = mpHists, 
           args=(histQ, Hdescriptors, 2000., 'Filter Histograms') ) )
 #             data Queue, Hist.Desrc  interval    
@@ -39,26 +39,44 @@ procs.append(mp.Process(name='Hists',
 VSigQ = mp.Queue(1) # information queue for Filter
 mode = 2 # 0:signed, 1: abs. 2: symmetric
 size = 1. # stretch factor for display
-procs.append(mp.Process(name = 'ChannelSignals',
+procs.append(BMan.ConsumerProcess(name = 'ChannelSignals',
           target = mpBDisplay, 
           args=(VSigQ, PSconf, mode, size, 'Panel Signals') ) )
 #               mp.Queue Chan.Conf.           name          
 
 PulseQ = mp.Queue(1)
-procs.append(mp.Process(name = 'PulseDisplay', target = mpPulseDisplay.mpPulseDisplay, args=(PulseQ,PSconf)))
+procs.append(BMan.ConsumerProcess(name = 'PulseDisplay', target = mpPulseDisplay.mpPulseDisplay, args=(PulseQ,PSconf)))
 
 
 
 # run pulse analysis
-cId_pf = BM.BMregister() # get a Buffer Manager Client Id
+NPulseWorkers = 1 # >1: events shared among several worker processes
+
+if NPulseWorkers > 1:
+  # consumer group 'pulse': each event analysed by one worker, results
+  #   merged in event order by the collector
+  resultQ = mp.Queue()
+  for i in range(NPulseWorkers):
+    cId_pf = BM.BMregister(group='pulse')
+    pulseProcessor = PulseProcessor.PulseProcessor(BM.BMgetClient(cId_pf), PSconf, cId_pf,
+          pulseDisplayQueue=PulseQ, logPulses=True, verbosity=1,
+          resultQueue=resultQ, templateCache='templateCache') # shared by workers
+    procs.append(BMan.ConsumerProcess(name = 'pulseProcessor%i' % i,
+          target = pulseProcessor.run))
+  procs.append(BMan.ConsumerProcess(name = 'pulseCollector',
+          target = PulseProcessor.mpPulseCollector,
+          args = (resultQ, NPulseWorkers, filtRateQ, histQ, VSigQ, True) ) )
+else:
+  cId_pf = BM.BMregister() # get a Buffer Manager Client Id
 
   # pulse analysis as thread
 #thrds.append(threading.Thread(target=pulseFilter,
 #      args = ( BM, PSconf, cId, filtRateQ, histQ, VSigQ, True, 1) ) )
 #                      BMclientId  RMeterQ  histQ  fileout verbose    
 
-pulseProcessor = PulseProcessor.PulseProcessor(BM, PSconf, cId_pf, filtRateQ, histQ, VSigQ, PulseQ, True, 2)
-procs.append(mp.Process(name = "pulseProcessor", target = pulseProcessor.run))
+  # light-weight client handle instead of Buffer Manager
+  pulseProcessor = PulseProcessor.PulseProcessor(BM.BMgetClient(cId_pf), PSconf, cId_pf, filtRateQ, histQ, VSigQ, PulseQ, True, 2)
+  procs.append(BMan.ConsumerProcess(name = "pulseProcessor", target = pulseProcessor.run))
 
   # pulse analysis as sub-process
 # procs.append(
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# code fragment  scanDAQ.py to run inside runDAQ.py
+'''
+  code fragment for a scan of trigger threshold and height of the
+   reference pulse of the PulseProcessor; use as ANAscript in
+   DAQconfig.yaml instead of anaDAQ.py
+
+   results per point (rates, life fraction, valid and coincident
+   pulses) are written to pulseLogs/scan_<date>.dat, the run ends
+   after the last point
+'''
+
+# ->>> code from here inserted as 'scanDAQ.py' in runDAQ.py
+
+from picodaqa.scanRunner import ScanRunner
+
+# import analysis code as library
+from myon import PulseProcessor
+
+scanGrid = [('trgThr', [-0.015, -0.020, -0.025, -0.030, -0.040]),
+            ('pulseHeight', [-0.030, -0.035])]
+NEventsPerPoint = 500 # events analysed per point
+TPerPoint = 120.      # or maximum time (s) per point
+scanFile = None       # recorded events (mpRecorder): scan offline,
+                      #   analysis parameters only
+
+cId_scan = BM.BMregister() # get a Buffer Manager Client Id
+
+def makeProcessor(point):
+  # PulseProcessor with reference pulse for this point
+  shape = {'name': 'myonic', 'shape': 'myonic', 'tauRise': 20E-9,
+           'tauOn': 12E-9, 'tauFall': 128E-9,
+           'pulseHeight': point['pulseHeight']}
+  return PulseProcessor.PulseProcessor(BM.BMgetClient(cId_scan), PSconf,
+           cId_scan, verbosity=0, templateShapes=[shape])
+
+def runScan():
+  S = ScanRunner(scanGrid, makeProcessor,
+                 counters=['validCount', 'coincidenceCount'],
+                 NEvents=NEventsPerPoint, duration=TPerPoint)
+  if scanFile is None:
+    S.run(BM, cId_scan)
+  else:
+    BM.BMready(cId_scan) # no events requested
+    S.runOffline(scanFile)
+  datetime = time.strftime('%y%m%d-%H%M', time.gmtime())
+  S.write('pulseLogs/scan_' + datetime + '.dat')
+  BM.BMCommandQue.put('E') # end run
+
+procs.append(BMan.ConsumerProcess(name = 'scanRunner', target = runScan))
+
+# <<< - end of inserted code
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+'''
+.. module BMClient of picoDAQ
+
+   light-weight handle of a Buffer Manager client for consumer processes
+
+   carries only the shared memory of the event buffers, the client's
+   own channels, the control flags and the slot table; can be passed
+   to processes started with 'fork', 'spawn' or 'forkserver':
+
+     cId = BM.BMregister()
+     c = BM.BMgetClient(cId)
+     mp.Process(target=consumer, args=(c,) ).start()
+     ...
+     def consumer(c):
+       while c.ACTIVE.value:
+         e = c.getEvent(mode=0)
+
+   provides getEvent(), prlog(), ACTIVE, baseline and noiseVariance
+   as the Buffer Manager, i.e. it may replace it in existing consumers
+
+   run boundaries (see BufferMan.rollover()) are seen with the events:
+
+     c.onRunChange(newFile) # newFile(run, firstEvNr) called by getEvent()
+                            #   before first event of new run is returned
+
+   as are changes of the device configuration (BufferMan.reconfigure()):
+
+     c.onConfigChange(setScales) # setScales(version, firstEvNr, CRanges)
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, os, time
+
+from .BMlogger import messageKey, INFO, ERROR
+
+def boundaryOf(table, n, evNr):
+  '''entry for event evNr in ring of (number, first event), e.g. runs
+
+     Args: table, current (i.e. highest) number n, event number
+
+     Returns: number and first event
+  '''
+  N = len(table)
+  while n > 1 and table[n % N, 1] > evNr:
+    n -= 1
+  return n, int(table[n % N, 1])
+
+class BMClient(object):
+  '''access to events for one client of the Buffer Manager'''
+
+  def __init__(self, BM, client_index):
+    '''Args:
+         BM:           Buffer Manager instance
+         client_index: index as returned by BM.BMregister()
+    '''
+    self.client_index = client_index
+    self.shape = (BM.NBuffers, BM.NChannels, BM.NSamples)
+    self.CBMbuf = BM.CBMbuf
+    self.CtimeStamp = BM.CtimeStamp
+    self.CtrigStamp = BM.CtrigStamp
+    self.CclientTable = BM.CclientTable
+    self.Cbaseline = BM.baselineTracker.Cbaseline
+    self.Cvariance = BM.baselineTracker.Cvariance
+    self.ACTIVE = BM.ACTIVE
+    self.RUNNING = BM.RUNNING
+    self.request_Que = BM.request_Ques[client_index]
+    self.consumer_Que = BM.consumer_Ques[client_index]
+    self.BMlock = BM.BMlock
+    self.projection = BM.projections.get(client_index)
+    self.logger = BM.logger
+    self.BMT0 = BM.BMT0
+    self.runNumber = BM.runNumber
+    self.CrunTable = BM.CrunTable
+    self.run = None # run of last event
+    self.runCallback = None
+    self.confVersion = BM.confVersion
+    self.CconfTable = BM.CconfTable
+    self.CconfRanges = BM.CconfRanges
+    self.conf = None # configuration version of last event
+    self.confCallback = None
+    self.requested = False # request pending after timeout of getEvent()
+    self.mapArrays()
+
+  def mapArrays(self):
+    '''numpy arrays in shared memory'''
+    self.BMbuf = np.frombuffer(self.CBMbuf, 'f').reshape(self.shape)
+    self.timeStamp = np.frombuffer(self.CtimeStamp, 'f')
+    self.trigStamp = np.frombuffer(self.CtrigStamp, 'f')
+    self.clientTable = np.frombuffer(self.CclientTable, 'i').reshape(-1, 4)
+    self.baseline = np.frombuffer(self.Cbaseline, 'd')
+    self.noiseVariance = np.frombuffer(self.Cvariance, 'd')
+    self.runTable = np.frombuffer(self.CrunTable, 'i').reshape(-1, 2)
+    self.confTable = np.frombuffer(self.CconfTable, 'i').reshape(-1, 2)
+    self.confRanges = np.frombuffer(self.CconfRanges, 'd').reshape(
+        len(self.confTable), -1)
+
+  def __getstate__(self):
+    # numpy views would be pickled as copies
+    state = self.__dict__.copy()
+    for k in ('BMbuf', 'timeStamp', 'trigStamp', 'clientTable',
+              'baseline', 'noiseVariance', 'runTable', 'confTable',
+              'confRanges'):
+      del state[k]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.mapArrays()
+
+  def getEvent(self, client_index=None, mode=1, timeout=None):
+    '''
+    request event from Buffer Manager, as BufferMan.getEvent()
+
+      Arguments:
+
+        client_index: ignored, for compatibility with BufferMan.getEvent()
+        mode:   0: event pointer (olbigatory consumer)
+                1: copy of event data (random consumer)
+                2: copy of event (olbigatory consumer)
+        timeout: maximum waiting time (s), None: no limit; the request
+                 remains pending for the next call
+
+      Returns:
+
+        event data, None if Buffer Manager ended, client unregistered
+        or timeout
+    '''
+    ic = self.client_index
+    if self.clientTable[ic, 2] != os.getpid(): self.ready()
+    if not self.requested: self.request_Que.put(mode)
+    self.requested = True
+    cQ = self.consumer_Que
+    t0 = time.time()
+    while cQ.empty():
+      if not self.ACTIVE.value: return
+      if not self.clientTable[ic, 0]: # unregistered, queues drained
+        self.requested = False
+        return
+      if timeout is not None and time.time() - t0 > timeout: return
+      time.sleep(0.0005)
+    self.requested = False
+    if mode !=0 or self.clientTable[ic, 1] != 0 \
+        or self.clientTable[ic, 3]: # not strict or group member
+      # received copy of the event data
+      e = cQ.get()
+    else: # received pointer to event buffer
+      ibr = cQ.get()
+      evData = self.BMbuf[ibr]
+      if self.projection is not None:
+        evData = self.projection.apply(evData) # view of buffer
+      e = (self.trigStamp[ibr], self.timeStamp[ibr], evData)
+    if self.runNumber.value != self.run or \
+        self.confVersion.value != self.conf: self.checkBoundaries(e[0])
+    return e
+
+  def runOf(self, evNr):
+    '''Returns: run number and first event of run of event evNr'''
+    return boundaryOf(self.runTable, self.runNumber.value, evNr)
+
+  def configOf(self, evNr):
+    '''Returns: configuration version and channel ranges of event evNr'''
+    v, first = boundaryOf(self.confTable, self.confVersion.value, evNr)
+    return v, self.confRanges[v % len(self.confTable)].copy()
+
+  def onRunChange(self, callback):
+    '''callback(run, firstEvNr) before first event of a new run is returned'''
+    self.runCallback = callback
+
+  def onConfigChange(self, callback):
+    '''callback(version, firstEvNr, CRanges) before first event with
+       new device configuration is returned'''
+    self.confCallback = callback
+
+  def checkBoundaries(self, evNr):
+    r, first = self.runOf(evNr)
+    if self.run is not None and r != self.run and \
+        self.runCallback is not None:
+      self.runCallback(r, first)
+    self.run = r
+    v, first = boundaryOf(self.confTable, self.confVersion.value, evNr)
+    if self.conf is not None and v != self.conf and \
+        self.confCallback is not None:
+      self.confCallback(v, first, 
+                        self.confRanges[v % len(self.confTable)].copy())
+    self.conf = v
+
+  def ready(self):
+    '''record consumer process, i.e. client ready (see BMwaitClients)'''
+    self.clientTable[self.client_index, 2] = os.getpid()
+
+  def unregister(self):
+    '''release client slot, see BufferMan.BMunregister()'''
+    self.BMlock.acquire()
+    if self.clientTable[self.client_index, 0] and \
+        self.clientTable[self.client_index, 2] in (0, os.getpid()):
+      self.clientTable[self.client_index, 0] = 0
+      for Q in (self.request_Que, self.consumer_Que):
+        while not Q.empty():
+          Q.get()
+      self.requested = False
+    self.BMlock.release()
+
+  def prlog(self, m, level=None, key=None):
+    '''log message, as BufferMan.prlog()'''
+    if level is None: level = ERROR if m[:1] == '!' else INFO
+    if level < self.logger.level: return
+    self.logger.log('%.2f '%(time.time() - self.BMT0) + m, level,
+                    messageKey(m) if key is None else key)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+'''
+.. module BMchannel of picoDAQ
+
+   delivery channel from manageDataBuffer to a consumer
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+from multiprocessing import Pipe
+from multiprocessing.sharedctypes import RawArray
+
+class ShmChannel(object):
+  '''event delivery via shared memory
+
+     drop-in replacement for the multiprocessing Queue used by
+     BufferMan for delivery to consumers:
+
+       - event copies are written to a buffer in shared memory, only
+         event number and time are sent as a short notification
+         via a Pipe (no pickling of event data)
+       - the receiving end of the Pipe is a file descriptor, i.e.
+         event loops (select, asyncio) can wait for it
+
+     the event data returned by get() are a view of the shared buffer,
+     valid until the consumer requests the next event; projections
+     of events (module projection) occupy the beginning of the buffer
+  '''
+
+  def __init__(self, NChannels, NSamples):
+    self.Cbuf = RawArray('f', NChannels * NSamples)
+    self.buf = np.frombuffer(self.Cbuf, 'f')
+    self.rconn, self.wconn = Pipe(duplex=False)
+
+  def put(self, obj):
+    '''called by manageDataBuffer: event copy or pointer to buffer'''
+    if isinstance(obj, tuple):
+      evNr, evTime, evData = obj
+      self.buf[:evData.size].reshape(evData.shape)[:] = evData
+      self.wconn.send( (evNr, evTime, evData.shape) )
+    else:
+      self.wconn.send(obj)
+
+  def empty(self):
+    return not self.rconn.poll()
+
+  def get(self):
+    m = self.rconn.recv()
+    if isinstance(m, tuple):
+      evNr, evTime, shape = m
+      return evNr, evTime, self.buf[:shape[0] * shape[1]].reshape(shape)
+    return m
+
+  def fileno(self):
+    '''file descriptor, readable when an event is available'''
+    return self.rconn.fileno()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+'''
+.. module BMlogger of picoDAQ
+
+   logging for the Buffer Manager and its clients, cheap enough to be
+   called for every event:
+
+     - messages below the log level are discarded immediately
+     - per message key, at most rateLimit messages per second are
+       written, others are counted and summarized
+       ("suppressed 812 similar messages")
+     - all messages (also suppressed ones) are kept in a ring buffer
+       in memory, see recent()
+     - a background thread writes messages in batches to the console,
+       the log file and the display of mpBufManCntrl; it is re-created
+       in processes forked from the creating process
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import sys, os, re, time, threading, collections
+from multiprocessing import util
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+levelNames = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING,
+              'ERROR': ERROR}
+digits = re.compile('[0-9]+')
+
+def messageKey(m):
+  '''key of similar messages: beginning of text without numbers'''
+  return digits.sub('', m[:40])
+
+class BMlogger(object):
+  '''levelled, rate-limited logging with batched output'''
+
+  def __init__(self, level=INFO, rateLimit=10, ringSize=1000,
+               flushInterval=0.2):
+    '''Args:
+         level:         minimum level, number or name ('DEBUG', ...)
+         rateLimit:     maximum number of messages per key and second,
+                        None: no limit
+         ringSize:      number of messages kept in memory
+         flushInterval: time (s) between writes of the background thread
+    '''
+    self.level = levelNames.get(level, level)
+    self.rateLimit = rateLimit
+    self.flushInterval = flushInterval
+    self.ring = collections.deque(maxlen=ringSize)
+    self.pending = collections.deque() # messages to be written
+    self.keys = {} # key: [start of 1 s window, count, suppressed]
+    self.fileName = None
+    self.f = None
+    self.logQ = None
+    self.lock = threading.Lock()
+    self.pid = None # process of writer thread
+
+  def __getstate__(self):
+    # for processes started with spawn or forkserver
+    state = self.__dict__.copy()
+    state['lock'] = None
+    state['f'] = None
+    state['pending'] = collections.deque()
+    state['ring'] = collections.deque(maxlen=self.ring.maxlen)
+    state['pid'] = -1 # writer started in new process
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self.lock = threading.Lock()
+
+  def setQueue(self, Q):
+    '''one message at a time is shown by mpBufManCntrl'''
+    self.logQ = Q
+
+  def openFile(self, fileName):
+    '''new log file, replaced under the lock while the writer runs'''
+    f = open(fileName, 'w')
+    self.flush() # remaining messages to previous file
+    with self.lock:
+      if self.f is not None: self.f.close()
+      self.f = f
+      self.fileName = fileName
+
+  def closeFile(self):
+    if self.f is None: return
+    self.flush()
+    with self.lock:
+      if self.f is not None: self.f.close()
+      self.f = None
+      self.fileName = None
+
+  def log(self, m, level=INFO, key=None):
+    '''log message m; key identifies similar messages, see messageKey()'''
+    if level < self.level: return
+    if self.pid != os.getpid(): self.startWriter()
+    t = time.time()
+    self.ring.append( (t, level, m) )
+    if self.rateLimit is not None:
+      if key is None: key = messageKey(m)
+      k = self.keys.get(key)
+      if k is None or t - k[0] > 1.:
+        if k is not None and k[2]:
+          self.pending.append('   ... suppressed %i similar messages (%s)'
+                              % (k[2], key) )
+        self.keys[key] = [t, 1, 0]
+      elif k[1] < self.rateLimit:
+        k[1] += 1
+      else:
+        k[2] += 1
+        return
+    self.pending.append(m)
+
+  def recent(self, n=None, level=DEBUG):
+    '''Returns: last n messages of at least level as (time, level, text)'''
+    r = [e for e in list(self.ring) if e[1] >= level]
+    return r if n is None else r[-n:]
+
+  def startWriter(self):
+    '''start background writer in this process'''
+    if self.pid is not None and self.pid != os.getpid():
+      # forked: lock may be held by writer of parent, which also 
+      #   writes inherited messages and counts; file re-opened
+      self.lock = threading.Lock()
+      self.pending.clear()
+      self.keys = {}
+      if self.fileName is not None: self.f = open(self.fileName, 'a')
+    with self.lock:
+      if self.pid == os.getpid(): return
+      self.pid = os.getpid()
+      thr = threading.Thread(target=self.writer, name='BMlogger')
+      thr.daemon = True
+      thr.start()
+    # write remaining messages when (sub-)process ends
+    util.Finalize(self, self.flush, exitpriority=10)
+
+  def writer(self):
+    # one writer per process, runs as long as the process
+    while True:
+      time.sleep(self.flushInterval)
+      self.flush()
+
+  def flush(self):
+    '''write pending messages'''
+    t = time.time()
+    for key, k in list(self.keys.items()): # no further similar messages
+      if k[2] and t - k[0] > 1.:
+        self.pending.append('   ... suppressed %i similar messages (%s)'
+                            % (k[2], key) )
+        k[2] = 0
+    with self.lock:
+      lines = []
+      while len(self.pending):
+        lines.append(self.pending.popleft())
+      if not len(lines): return
+      i = 0
+      if self.logQ is not None and self.logQ.empty():
+        self.logQ.put(lines[0])
+        i = 1
+      if len(lines) > i:
+        print('\n'.join(lines[i:]))
+        sys.stdout.flush()
+      if self.f is not None:
+        self.f.write('\n'.join(lines) + '\n')
+        self.f.flush()
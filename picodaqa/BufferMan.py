@@ -8,13 +8,78 @@ from __future__ import print_function, division, unicode_literals
 from __future__ import absolute_import
 
 # - class BufferMan
-import numpy as np, sys, time, threading
+import numpy as np, sys, os, time, threading, zlib
 
-from multiprocessing import Queue, Process, Array
+import multiprocessing
+from multiprocessing import Queue, Process, Array, Pipe, Lock
 from multiprocessing.sharedctypes import RawValue, RawArray
 
 from .mpBufManCntrl import *
 from .mpOsci import * 
+from .procPlacement import *
+from .samplingPolicy import *
+from .EvtServer import mpEvtServer
+from .mpRecorder import mpRecorder
+from .roiExtract import mpROIExtractor
+from .baselineTracker import BaselineTracker
+from .BMchannel import ShmChannel
+from .eventFilter import EventFilter
+from .projection import Projection
+from .BMlogger import BMlogger, messageKey, DEBUG, INFO, WARNING, ERROR
+from .BMClient import BMClient, boundaryOf
+
+# channels to clients, usable by processes started with any method
+#   (BMClient handles may be passed to 'spawn' or 'forkserver' processes)
+try:
+  clientContext = multiprocessing.get_context('spawn')
+except AttributeError: # python 2, 'fork' only
+  clientContext = multiprocessing
+
+clientPolicies = ['strict', 'lag', 'deadline'] # codes in client slot table
+displayProcs = ['BufManCntrl', 'Osci'] # do not end by themselves
+NRunsKept = 16 # run boundaries known to clients, see BMClient.runOf()
+NConfKept = 16 # configuration versions known to clients, BMClient.configOf()
+# device settings which may be changed during a run, see reconfigure()
+reconfigKeys = ['trgChan', 'trgThr', 'trgTyp', 'trgDelay', 'trgTO', 
+                'trgActive', 'ChanRanges', 'ChanModes', 'ChanOffsets']
+
+class ConsumerProcess(Process):
+  '''multiprocessing.Process keeping its target and arguments, 
+     i.e. it may be restarted by BufferMan.watchProcess()'''
+
+  def __init__(self, name=None, target=None, args=(), kwargs=None):
+    if kwargs is None: kwargs = {}
+    Process.__init__(self, name=name, target=target, args=args, 
+                     kwargs=kwargs)
+    self.spec = (name, target, tuple(args), dict(kwargs))
+
+def initDevice(DevConf, conn):
+  # sub-process: initialise device, send sampling parameters, close device
+  DevConf.init()
+  conn.send(DevConf.getSamplingPars() )
+  DevConf.closeDevice()
+  conn.close()
+
+def probeDevice(DevConf, timeout=60.):
+  '''
+  sampling parameters of a device initialised in a short-lived 
+  sub-process, i.e. the device is not opened by this process and may 
+  be opened by the producer process (ProducerMode 'process')
+
+    Args: device configuration, e.g. PSconfig, not initialised
+  '''
+  conn, devConn = Pipe()
+  prc = Process(name='probeDevice', target=initDevice, args=(DevConf, devConn))
+  prc.start()
+  try:
+    pars = conn.recv() if conn.poll(timeout) else None
+  except EOFError: # initialisation failed
+    pars = None
+  prc.join(timeout)
+  if pars is None:
+    print('!=! probeDevice: error initialising device - exit')
+    sys.exit(1)
+  DevConf.setSamplingPars(*pars)
 
 class BufferMan(object):
   '''
@@ -46,7 +111,15 @@ class BufferMan(object):
      self.LogFile = BMdict["LogFile"]
     else:
       self.LogFile = None
-    self.flog = None    # file not yet open
+    if "LogLevel" in BMdict: 
+      LogLevel = BMdict["LogLevel"] # DEBUG, INFO, WARNING or ERROR
+    else:
+      LogLevel = 'INFO'
+    if "LogRateLimit" in BMdict: # messages per second and message type
+      LogRateLimit = BMdict["LogRateLimit"]
+    else:
+      LogRateLimit = 10
+    self.logger = BMlogger(LogLevel, LogRateLimit)
     if "verbose" in BMdict: 
       self.verbose = BMdict["verbose"]
     else:
@@ -55,6 +128,64 @@ class BufferMan(object):
       self.logTime = BMdict["logTime"] # display modules to start
     else:
       self.logTime = 60 # logging information once per 60 sec
+    if "ProducerMode" in BMdict: 
+      self.ProducerMode = BMdict["ProducerMode"] # 'thread' or 'process'
+    else:
+      self.ProducerMode = 'thread'
+    if "SamplingRates" in BMdict: 
+      self.SamplingRates = BMdict["SamplingRates"] # {consumer: rate in Hz}
+    else:
+      self.SamplingRates = {}
+    if "BufferWatermarks" in BMdict: 
+      lowWM, highWM = BMdict["BufferWatermarks"] # for random consumers
+    else:
+      lowWM, highWM = 0.25, 0.5
+    if "MaxClients" in BMdict: 
+      self.MaxClients = BMdict["MaxClients"] # maximum number of BM clients
+    else:
+      self.MaxClients = 16
+    if "EvtServerPort" in BMdict: 
+      self.EvtServerPort = BMdict["EvtServerPort"] # TCP port of EvtServer
+    else:
+      self.EvtServerPort = 5500
+    if "EvtServerHost" in BMdict: 
+      self.EvtServerHost = BMdict["EvtServerHost"] # '' for all interfaces
+    else:
+      self.EvtServerHost = 'localhost'
+    if "EvtServerType" in BMdict: 
+      self.EvtServerType = BMdict["EvtServerType"] # 'float32' or 'int16'
+    else:
+      self.EvtServerType = 'float32'
+    if "RecordFile" in BMdict: 
+      self.RecordFile = BMdict["RecordFile"] # output of mpRecorder
+    else:
+      self.RecordFile = 'picoDAQ_events.dat'
+    if "RecordCompression" in BMdict: # options for compressEvent()
+      self.RecordCompression = dict(BMdict["RecordCompression"])
+    else:
+      self.RecordCompression = {}
+    if "ROIThreshold" in BMdict: 
+      self.ROIThreshold = BMdict["ROIThreshold"] # pulse threshold in Volt
+    else:
+      self.ROIThreshold = None
+    if "ROINsigma" in BMdict: # threshold in units of baseline sigma
+      self.ROINsigma = BMdict["ROINsigma"]
+    else:
+      self.ROINsigma = 5.
+    if "ROIWindow" in BMdict: # samples kept before and after pulses
+      self.ROIWindow = BMdict["ROIWindow"]
+    else:
+      self.ROIWindow = (20, 100)
+    if "RestartConsumers" in BMdict: # max. number of restarts of consumers
+      self.RestartConsumers = BMdict["RestartConsumers"] # (see watchProcess)
+    else:
+      self.RestartConsumers = 0
+    if "BaselineAlpha" in BMdict: # weight of new event for running baseline
+      self.BaselineAlpha = BMdict["BaselineAlpha"]
+    else:
+      self.BaselineAlpha = 0.02
+  # optional CPU sets and priorities for threads and processes
+    self.placement = placementConfig(BMdict)
 
 # read device congiguration and set up Buffer space
     self.DevConf = DevConf  
@@ -77,6 +208,12 @@ class BufferMan(object):
 
     self.ibufr = RawValue('i', -1) # read index, synchronization with producer 
 
+# running baseline and noise per channel, from pre-trigger region
+    self.baselineTracker = BaselineTracker(self.NChannels, 
+      int(self.NSamples * DevConf.pretrig), self.BaselineAlpha)
+    self.baseline = self.baselineTracker.baseline # shared numpy arrays
+    self.noiseVariance = self.baselineTracker.variance
+
 # global variables for producer statistics
     self.Ntrig = RawValue('i', 0)    # count number of readings
     self.Ttrig = RawValue('f', 0.)   # time of last event
@@ -84,6 +221,28 @@ class BufferMan(object):
     self.readrate = RawValue('f', 0) # current rate                
     self.lifefrac = RawValue('f', 0) # current life-time
 
+# run numbering, a new run starts without stopping acquisition (rollover())
+    self.runNumber = RawValue('i', 1)
+    self.runNext = RawValue('i', 0) # first event of next run, 0: none
+    self.runSeen = RawValue('i', 1) # run reached by manageDataBuffer
+    self.runT0 = RawValue('d', 0.)  # start time of run, set by producer
+    self.runTlife0 = RawValue('f', 0.) # life time at start of run
+    #   ring of (run number, first event), indexed by run number
+    self.CrunTable = RawArray('i', NRunsKept * 2)
+    self.runTable = np.frombuffer(self.CrunTable, 'i').reshape(NRunsKept, 2)
+    self.runTable[1] = (1, 1)
+
+# version of device configuration, incremented by reconfigure()
+    self.confVersion = RawValue('i', 1)
+    #   ring of (version, first event) and channel ranges of each version
+    self.CconfTable = RawArray('i', NConfKept * 2)
+    self.confTable = np.frombuffer(self.CconfTable, 'i').reshape(NConfKept, 2)
+    self.confTable[1] = (1, 1)
+    self.CconfRanges = RawArray('d', NConfKept * self.NChannels)
+    self.confRanges = np.frombuffer(self.CconfRanges, 'd').reshape(
+        NConfKept, self.NChannels)
+    self.confRanges[1] = DevConf.CRanges[:self.NChannels]
+
 # set up variables for Buffer Manager status and accounting  
     self.BMT0 = 0.
     self.tPause = 0.  # time when last paused
@@ -91,25 +250,72 @@ class BufferMan(object):
     self.ACTIVE = RawValue('b', 0) 
     self.RUNNING = RawValue('b', 0)
     self.STOPPED = False
+    self.dTPause0 = 0.  # pause time and restarts before start of run
+    self.Nrestarts0 = 0
 
   # queues ( multiprocessing Queues for communication with sub-processes)
     self.prod_Que = Queue(self.NBuffers) # acquireData <-> manageDataBuffer
-    self.request_Ques=[] # consumer request to manageDataBuffer
+  #   one slot per client, allocated before manageDataBuffer is forked, 
+  #   i.e. clients may register and unregister during a run
+    self.request_Ques = [clientContext.Queue(1) 
+                         for i in range(self.MaxClients)] 
+                # consumer request to manageDataBuffer
                 # 0:  request event pointer, obligatory consumer
                 # 1:  request event data, random consumer 
                 # 2:  request event data, obligatoray consumer
-    self.consumer_Ques=[] # data from manageDataBuffer to consumer
+    self.consumer_Ques = [clientContext.Queue(1) 
+                          for i in range(self.MaxClients)] 
+                # data from manageDataBuffer to consumer
+    # client slot table in shared memory: 
+    #   state (0: free, 1: active), policy code, PID of consumer process,
+    #   consumer group (0: none)
+    self.CclientTable = RawArray('i', self.MaxClients * 4)
+    self.clientTable = np.frombuffer(self.CclientTable, 'i').reshape(
+        self.MaxClients, 4)
+    self.groupNext = {} # round-robin position in consumer groups
+    self.CclientPar = RawArray('d', self.MaxClients) # policy parameter
+    self.clientPar = np.frombuffer(self.CclientPar, 'd')
+    self.NSlotsUsed = RawValue('i', 0) # highest slot ever used + 1
+    self.Nreclaimed = RawValue('i', 0) # events released from dead clients
+    self.Ndone = RawValue('i', 0) # events released by manageDataBuffer
+    self.prodIdle = RawValue('b', 1) # producer waiting for RUNNING state
+    self.reconfPending = RawValue('b', 0) # reconfigure() waits for producer
+    self.watched = [] # consumer processes to restart, see watchProcess()
+    self.Nrestarts = 0
+    # per-client counters in shared memory: 
+    #   delivered events, skipped events, deadline misses, rejected events
+    self.CclientStats = RawArray('i', self.MaxClients * 4)
+    self.clientStats = np.frombuffer(self.CclientStats, 'i').reshape(
+        self.MaxClients, 4)
+    #   ... and their values at start of run, copied by manageDataBuffer
+    self.CclientStats0 = RawArray('i', self.MaxClients * 4)
+    self.clientStats0 = np.frombuffer(self.CclientStats0, 'i').reshape(
+        self.MaxClients, 4)
+    self.Nreclaimed0 = RawValue('i', 0)
+    self.clientCfgQue = clientContext.Queue() 
+                          # (client index, kind, object) to manageDataBuffer
+    self.filters = {} # event filters of clients
+    self.projections = {} # projections of events for clients
+    self.clients = {} # client handles, see BMgetClient()
 
   # multiprocessing Queues for data transfer to subprocesses
     self.mpQues = []
+    self.mpQsampler = RandomSampler(lowWM, highWM) # sampling policy for mpQues
+    self.mpProjections = [] # projections of events for mpQues
+    self.roiQues = [] # subscribers to stream of sparse events (roiExtract)
     self.BMInfoQue = None
 
-    self.BMlock = threading.Lock() 
+    self.BMlock = clientContext.Lock() # protects slot table, shared by all
+                                       #   processes
     self.logQ = None
 
  # keep track of sub-processes started by BufferManager   
     self.procs=[] # list of sub-processes started by BufferMan
+    self.runStarted = False
     self.thrds=[] # list of sub-processes started by BufferMan
+    self.prodProc = None # producer process, if ProducerMode is 'process'
+    self.prodCmd = None  # command pipe to producer process
+    self.reconfTag = 0   # tag of last reconfigure request to producer
 
 # -- end of __init__()    
     
@@ -130,6 +336,7 @@ class BufferMan(object):
 
     '''
 #    self.prlog('*==* BufMan:  !!! acquireData starting')
+    self.placeProcess('acquireData')
     tlife = 0.
 
     ni = 0       # temporary variable
@@ -146,10 +353,12 @@ class BufferMan(object):
         time.sleep(0.0005)
 #
       while not self.RUNNING.value:   # wait for running status 
+        self.prodIdle.value = True
         if not self.ACTIVE.value: 
           if self.verbose: self.prlog('*==* BufMan.acquireData()  ended')
           return
         time.sleep(0.01)
+      self.prodIdle.value = False
 
 # data acquisition from hardware
       e = self.rawDAQproducer(self.BMbuf[ibufw])
@@ -159,11 +368,16 @@ class BufferMan(object):
       ttrg, tl = e
       tlife += tl
       self.Tlife.value += tl
+      if ttrg is None: # stopped waiting for trigger, see reconfigure()
+        ibufw = (ibufw - 1) % self.NBuffers # buffer not used
+        continue
       ttrg -= self.BMT0
       self.timeStamp[ibufw] = ttrg  # store time when data became ready
       self.Ttrig.value = ttrg
       self.Ntrig.value += 1
       self.trigStamp[ibufw]=self.Ntrig.value
+      if self.runNext.value and self.Ntrig.value >= self.runNext.value:
+        self.newRun(ttrg + self.BMT0, self.Tlife.value - tl)
       self.prod_Que.put( ibufw )
        
 # wait for free buffer       
@@ -186,6 +400,73 @@ class BufferMan(object):
     return
 # -- end def acquireData
 
+  def newRun(self, t, Tlife):
+    '''producer: last event is the first one of a new run
+
+       Args: start time and life time at start of run
+    '''
+    r = self.runNumber.value + 1
+    self.runTable[r % NRunsKept] = (r, self.Ntrig.value)
+    self.runT0.value = t
+    self.runTlife0.value = Tlife
+    self.runNext.value = 0
+    self.runNumber.value = r # last, table entry complete for clients
+
+  def runOf(self, evNr):
+    '''Returns: run number and first event of run of event evNr'''
+    return boundaryOf(self.runTable, self.runNumber.value, evNr)
+
+# -- producer as a sub-process owning the hardware device
+  def mpProducer(self, cmdConn):
+    '''
+     Producer Process 
+
+       runs acquireData() isolated from the main process, i.e. 
+       without competing for the interpreter lock with user code;
+       ring buffer and counters are in shared memory, commands
+       are received via a multiprocessing Pipe; the device is opened
+       here, i.e. it must not be initialised by the main process 
+       (see probeDevice())
+
+       Arg: connection to receive commands
+    '''
+    def readProducerCommands():
+      while True:
+        try:
+          cmd = cmdConn.recv()
+        except (EOFError, IOError):
+          return
+        self.execProducerCommand(cmd, cmdConn)
+
+    thr_cmd = threading.Thread(target=readProducerCommands)
+    thr_cmd.daemon = True
+    thr_cmd.start()
+    self.DevConf.init() # device opened and initialised in this process
+    cmdConn.send(self.DevConf.getSamplingPars() ) # i.e. 'ready'
+    self.acquireData()
+    # producer owns the device, close it on exit
+    if hasattr(self.DevConf, 'closeDevice'): 
+      self.DevConf.closeDevice()
+    cmdConn.close()
+
+  def execProducerCommand(self, cmd, cmdConn):
+    '''execute command received by producer process'''
+    if cmd[0] == 'T0':      # start time of run
+      self.BMT0 = cmd[1]
+    elif cmd[0] == 'C':     # change device settings, reply tag and ranges
+      try:
+        cmdConn.send( (cmd[2], self.DevConf.reconfigure(cmd[1]) ) )
+      except Exception as e:
+        self.prlog('!=! mpProducer: reconfigure failed: ' + str(e))
+        cmdConn.send( (cmd[2], None) )
+    else:
+      self.prlog('!=! mpProducer: invalid command ' + str(cmd[0]))
+
+  def sendProducerCommand(self, *cmd):
+    '''send command to producer process, ignored in thread mode'''
+    if self.prodCmd is not None:
+      self.prodCmd.send(cmd)
+
 # -- the central Buffer Manager - runs as a thread or sub-process
   def manageDataBuffer(self):
     '''main Consumer Thread 
@@ -195,9 +476,14 @@ class BufferMan(object):
        - provide subset of events to "random" consumers (picoVMeter, oscilloscope)
 
     '''
+    self.placeProcess('manageDataBuffer')
     t0=time.time()
     n0=0
     n=0
+    isReady = lambda i: self.mpQues[i].empty()
+    s_oblig=set() # clients requesting events as obligatory consumer
+    tcheck=time.time() # last check for dead clients
+    run = self.runSeen.value
     while self.ACTIVE.value:
       while self.prod_Que.empty(): # wait for pointer to data in producer queue
         if not self.ACTIVE.value:
@@ -205,42 +491,99 @@ class BufferMan(object):
           return
         time.sleep(0.0005)
       self.ibufr.value = self.prod_Que.get()
+      n+=1
       evNr = self.trigStamp[self.ibufr.value]
       evTime=self.timeStamp[self.ibufr.value]
+      self.baselineTracker.update(self.BMbuf[self.ibufr.value])
+      if self.runNumber.value != run and self.runOf(evNr)[0] != run: 
+      # first event of new run, per-run counters start here
+        self.clientStats0[:] = self.clientStats
+        self.Nreclaimed0.value = self.Nreclaimed.value
+        run = self.runOf(evNr)[0]
+        self.runSeen.value = run
+      while not self.clientCfgQue.empty(): # new filters or projections
+        i, kind, obj = self.clientCfgQue.get()
+        d = self.filters if kind == 'filter' else self.projections
+        if obj is None: 
+          d.pop(i, None)
+        else:
+          d[i] = obj
  
 # check if other threads or sup-processes request data
 #     next request treated as "done" for obligatory consumers
       l_obligatory=[]
-      if len(self.request_Ques):
-        for i, Q in enumerate(self.request_Ques):
+      active = self.activeClients()
+      s_oblig.intersection_update(active)
+      if len(active):
+        for i in active:
+          if self.clientTable[i, 3]: continue # member of consumer group
+          Q = self.request_Ques[i]
           if not Q.empty():
+            if not self.acceptEvent(i): continue # rejected by event filter
             req = Q.get()
-            if req==0:                          # return poiner to Buffer      
-              self.consumer_Ques[i].put( self.ibufr.value ) 
+            if req==0 and self.clientTable[i, 1] == 0:  # strict policy
+              self.consumer_Ques[i].put( self.ibufr.value ) # poiner to Buffer
               l_obligatory.append(i)
             elif req==1:                               # return a copy of data
               self.consumer_Ques[i].put( (evNr, evTime, 
-                    self.BMbuf[self.ibufr.value]) ) 
-            elif req==2:                   # return copy and mark as obligatory
+                    self.clientData(i)) ) 
+            elif req==2 or req==0:         # return copy and mark as obligatory
               self.consumer_Ques[i].put( (evNr, evTime, 
-                      BMbuf[self.ibufr.value]) ) 
+                      self.clientData(i)) ) 
               l_obligatory.append(i)
             else:
-              self.prlog('!=! manageDataBuffer: invalid request mode', req)
+              self.prlog('!=! manageDataBuffer: invalid request mode %i' % req)
               sys.exit(1)
+            self.clientStats[i, 0] += 1
+            if req==1: 
+              s_oblig.discard(i)
+            else:
+              s_oblig.add(i)
+          elif i in s_oblig and self.acceptEvent(i): 
+            self.clientStats[i, 1] += 1 # obligatory consumer not ready
               
-# provide data via a mp-Queue at lower priority if Buffer is not full
-      if len(self.mpQues) and self.prod_Que.qsize() <= self.NBuffers/2 :
-        for Q in self.mpQues:
-          if Q.empty(): # put an event in the Queue
-            Q.put( (evNr, evTime, self.BMbuf[self.ibufr.value] ) )
+# consumer groups: event goes to exactly one free worker of each group
+      for gid in set(self.clientTable[active, 3]) - set([0]):
+        # filter of first worker with a filter, evaluated once per group
+        f = [i for i in active[self.clientTable[active, 3] == gid]
+             if i in self.filters]
+        if len(f) and not self.acceptEvent(f[0]): continue
+        if not self.deliverToGroup(gid, evNr, evTime):
+          if self.verbose: self.prlog('*==* BufMan ended')
+          return
 
-# wait until all obligatory consumers are done
+# provide data via a mp-Queue at lower priority, 
+#   paced by sampling policy depending on buffer filling level
+      if len(self.mpQues):
+        fill = (self.Ntrig.value - n)/self.NBuffers # events waiting
+        for i in self.mpQsampler.select(fill, time.time(), isReady):
+          self.mpQues[i].put( (evNr, evTime, 
+            self.BMbuf[self.ibufr.value] if self.mpProjections[i] is None
+            else self.mpProjections[i].apply(self.BMbuf[self.ibufr.value]) ) )
+
+# wait until all obligatory consumers are done, 
+#   or release event according to consumer policy
       if len(l_obligatory):
+        tw = time.time()
+        tl = tw # last check for dead clients
         while self.ACTIVE.value:
+          if time.time() - tl > 0.1: # clients holding event still alive ?
+            tl = time.time()
+            for i in self.releaseDeadClients():
+              if i in l_obligatory: self.Nreclaimed.value += 1
           done = True
-          for i in l_obligatory:
-            if self.request_Ques[i].empty(): done = False
+          for i in l_obligatory[:]:
+            if not self.clientTable[i, 0]: # client unregistered
+              l_obligatory.remove(i)
+            elif self.request_Ques[i].empty(): 
+              policy, par = self.getClientPolicy(i)
+              if policy == 'lag' and self.Ntrig.value - n > par:
+                l_obligatory.remove(i)  # release, next events skipped
+              elif policy == 'deadline' and (time.time() - tw)*1000. > par:
+                self.clientStats[i, 2] += 1 # deadline miss
+                l_obligatory.remove(i)
+              else:
+                done = False
           if done: break
           if not self.ACTIVE.value: 
             if self.verbose: self.prlog('*==* BufMan ended')
@@ -248,9 +591,14 @@ class BufferMan(object):
           time.sleep(0.0005)        
 #  signal to producer that all consumers are done with this event
       self.ibufr.value = -1
+      self.Ndone.value += 1
+
+# release slots of clients whose process has ended
+      if time.time() - tcheck > 1.:
+        tcheck = time.time()
+        self.releaseDeadClients()
 
 # print event rate
-      n+=1
       if time.time()-t0 >= self.logTime:
         t0 = time.time()
         if self.verbose:
@@ -264,44 +612,259 @@ class BufferMan(object):
     return
 # -- end def manageDataBuffer()
 
+  def acceptEvent(self, client_index):
+    '''apply event filter of client to current event, count rejects'''
+    f = self.filters.get(client_index)
+    if f is None: return True
+    try:
+      if f.accept(self.BMbuf[self.ibufr.value]): return True
+    except Exception as e:
+      self.prlog('!=! event filter of client %i removed: %s' 
+                 % (client_index, str(e)) )
+      del self.filters[client_index]
+      return True
+    self.clientStats[client_index, 3] += 1
+    return False
+
+  def clientData(self, client_index):
+    '''current event buffer, or its projection for client'''
+    p = self.projections.get(client_index)
+    if p is None: return self.BMbuf[self.ibufr.value]
+    return p.apply(self.BMbuf[self.ibufr.value])
+
+  def deliverToGroup(self, gid, evNr, evTime):
+    '''give copy of current event to next free worker of consumer group
+
+       waits until a worker requests an event, 
+       returns False if Buffer Manager ended
+    '''
+    tl = time.time() # last check for dead clients
+    while self.ACTIVE.value:
+      active = self.activeClients()
+      members = list(active[self.clientTable[active, 3] == gid])
+      if not len(members): return True # group gone
+      # round robin, starting after last served worker
+      k = gid in self.groupNext and self.groupNext[gid] in members \
+           and members.index(self.groupNext[gid]) + 1 or 0
+      for i in members[k:] + members[:k]:
+        if not self.request_Ques[i].empty():
+          self.request_Ques[i].get()
+          self.consumer_Ques[i].put( (evNr, evTime, 
+                                      np.array(self.clientData(i))) )
+          self.clientStats[i, 0] += 1
+          self.groupNext[gid] = i
+          return True
+      if time.time() - tl > 0.1:
+        tl = time.time()
+        self.releaseDeadClients()
+      time.sleep(0.0005)
+    return False
+
+  def releaseDeadClients(self):
+    '''unregister clients whose consumer process has ended
+
+       Returns: list of released client indices
+    '''
+    released = []
+    for i in self.activeClients():
+      pid = self.clientTable[i, 2]
+      if pid > 0 and not processAlive(pid):
+        self.prlog('!=! manageDataBuffer: client %i (PID %i) ended, released'
+                   % (i, pid) )
+        self.BMunregister(i, pid)
+        released.append(i)
+    return released
+
 
 # -- helper functions for interaction with BufferManager
 
-  def BMregister(self):
+  def BMregister(self, policy='strict', maxLag=4, deadline=100., 
+                 channel='queue', group=None, evFilter=None, 
+                 projection=None):
     ''' 
     register a client to Buffer Manager
 
+    Args:
+      policy: back-pressure policy if client is an obligatory consumer
+        'strict':   data acquisition waits for client (default)
+        'lag':      events are skipped if more than maxLag events 
+                    are waiting in the buffer
+        'deadline': event is released after deadline ms, counted as miss
+      maxLag:   maximum number of waiting events for policy 'lag'
+      deadline: time in ms for policy 'deadline'
+      channel:  delivery channel, 'queue' (multiprocessing Queue) or 
+                'shm' (shared memory, see BMchannel and asyncBMClient)
+      group:    name of consumer group; each event is given to exactly 
+                one free worker of a group, as a copy, i.e. several 
+                workers share the load (see consumerGroup)
+      evFilter: EventFilter (module eventFilter) or numpy expression of
+                event data d; rejected events are not delivered and 
+                counted, see BMsetFilter(); the filter of a consumer 
+                group is the one of its first worker with a filter
+      projection: Projection (module projection), only this part of
+                the event is delivered to the client
+
+    clients with policy 'lag' or 'deadline' always receive a copy of
+    the event data, as buffers may be overwritten while still in use 
+
     Returns: client index
     '''
 
+    if policy == 'strict':
+      par = 0.
+    elif policy == 'lag':
+      par = min(maxLag, self.NBuffers - 2) # producer stops if buffer full
+    elif policy == 'deadline':
+      par = deadline
+    else:
+      self.prlog('!=! BMregister: invalid policy ' + str(policy))
+      sys.exit(1)
+    if channel == 'shm' and self.runStarted:
+      self.prlog('!=! BMregister: channel shm must be set up before run()')
+      sys.exit(1)
+
     self.BMlock.acquire() # called by many processes, needs protection ...  
-    self.request_Ques.append(Queue(1))
-    self.consumer_Ques.append(Queue(1))
-    client_index=len(self.request_Ques)-1
+    client_index = -1
+    for i in range(self.MaxClients):
+    # free slot, with shared-memory channel only if requested
+      if self.clientTable[i, 0] == 0 and (channel == 'shm') == \
+          isinstance(self.consumer_Ques[i], ShmChannel):
+        client_index = i
+        break
+    if client_index < 0 and channel == 'shm':
+      for i in range(self.MaxClients):
+        if self.clientTable[i, 0] == 0:
+          client_index = i
+          self.consumer_Ques[i] = ShmChannel(self.NChannels, self.NSamples)
+          break
+    if client_index < 0:
+      self.BMlock.release()
+      self.prlog('!=! BMregister: maximum number of clients reached')
+      sys.exit(1)
+    self.drainClientQues(client_index) # left over from previous client
+    self.clientStats[client_index] = 0
+    self.clientPar[client_index] = par
+    gid = 0 if group is None else zlib.crc32(group.encode('utf-8')) & 0x7fffffff or 1
+    self.clientTable[client_index] = (1, clientPolicies.index(policy), 0, gid)
+    self.NSlotsUsed.value = max(self.NSlotsUsed.value, client_index + 1)
     self.BMlock.release()
+    self.BMsetFilter(client_index, evFilter)
+    if projection is not None: projection.bind(self.DevConf)
+    self.projections[client_index] = projection # for pointer delivery
+    self.clients.pop(client_index, None)
+    self.clientCfgQue.put( (client_index, 'projection', projection) )
   
     if self.verbose:
-      self.prlog("*==* BMregister: new client id=%i" % client_index)
+      self.prlog("*==* BMregister: new client id=%i, policy %s" % 
+                 (client_index, policy) )
     return client_index
 
-  def BMregister_mpQ(self):
+  def BMunregister(self, client_index, pid=None):
+    '''unregister client, slot may be re-used by other clients
+
+       may be called during a run, from any process; 
+       manageDataBuffer stops waiting for the client
+
+       Args: 
+         client_index: index as returned by BMregister()
+         pid: unregister only if client belongs to process pid
+    '''
+    self.BMlock.acquire()
+    if self.clientTable[client_index, 0] and \
+        (pid is None or self.clientTable[client_index, 2] == pid):
+      self.clientTable[client_index, 0] = 0
+      self.drainClientQues(client_index)
+      if self.verbose:
+        self.prlog("*==* BMunregister: client id=%i" % client_index)
+    self.BMlock.release()
+
+  def BMsetFilter(self, client_index, evFilter):
+    '''set or replace (None: remove) event filter of client
+
+       evaluated by manageDataBuffer on the event buffer, 
+       before the event is delivered; may be called during a run
+
+       Args: 
+         client_index: index as returned by BMregister()
+         evFilter:     EventFilter or numpy expression of event data d
+    '''
+    if evFilter is not None and not isinstance(evFilter, EventFilter):
+      evFilter = EventFilter(evFilter)
+    self.clientCfgQue.put( (client_index, 'filter', evFilter) )
+
+  def drainClientQues(self, client_index):
+    '''remove pending requests and events of client'''
+    for Q in (self.request_Ques[client_index], 
+              self.consumer_Ques[client_index]):
+      while not Q.empty():
+        Q.get()
+
+  def getClientPolicy(self, client_index):
+    '''Returns: policy, parameter of client'''
+    return (clientPolicies[self.clientTable[client_index, 1]], 
+            self.clientPar[client_index])
+
+  def activeClients(self):
+    '''Returns: indices of registered clients'''
+    return np.nonzero(self.clientTable[:self.NSlotsUsed.value, 0])[0]
+
+  def BMgetClientStats(self):
+    '''Returns: list of (policy, delivered, skipped, missed, rejected) 
+                per client slot'''
+    return [ (self.getClientPolicy(i)[0],) + tuple(int(c) for c in 
+             self.clientStats[i]) for i in range(self.NSlotsUsed.value) ]
+
+  def BMregister_mpQ(self, name=None, rate=None, projection=None):
 #   multiprocessing Queue
     ''' 
     register a subprocess to Buffer Manager
     
     data will be transferred via a multiprocess Queue
+
+    Args:
+      name: consumer name, to look up target rate in SamplingRates
+      rate: target rate in Hz (None: as often as possible)
+      projection: Projection, only this part of events is transferred
     
     Returns: client index
              multiprocess Queue
     '''
 
+    if rate is None and name in self.SamplingRates:
+      rate = self.SamplingRates[name]
     self.mpQues.append( Queue(1) )
+    self.mpQsampler.add(rate)
+    if projection is not None: projection.bind(self.DevConf)
+    self.mpProjections.append(projection)
     cid=len(self.mpQues)-1
   
     if self.verbose:
       self.prlog("*==* BMregister_mpQ: new subprocess client id=%i" % cid)
     return cid, self.mpQues[-1]
 
+  def BMregister_roiQ(self, lossless=False, maxsize=16):
+    ''' 
+    subscribe to the stream of sparse events (regions of interest)
+
+    Args:
+      lossless: if True, data acquisition waits for the subscriber,
+                else events are dropped if the Queue is full; without
+                lossless subscribers, only events the extractor has 
+                time for are published
+      maxsize:  length of Queue
+
+    Returns: multiprocess Queue, receives roiExtract.SparseEvent
+             objects, None at end of run
+    '''
+    if self.runStarted:
+      self.prlog('!=! BMregister_roiQ: must be called before run()')
+      sys.exit(1)
+    self.roiQues.append( (Queue(maxsize), lossless) )
+    if self.verbose:
+      self.prlog("*==* BMregister_roiQ: new %s subscriber" % 
+                 ('lossless' if lossless else 'sampled') )
+    return self.roiQues[-1][0]
+
 # -- encapsulates data access for obligatory and random clients  
   def getEvent(self, client_index, mode=1):
     ''' 
@@ -319,20 +882,42 @@ class BufferMan(object):
         event data
     '''
 
-    self.request_Ques[client_index].put(mode)
-    cQ=self.consumer_Ques[client_index]
-    while cQ.empty():
-      if not self.ACTIVE.value: return
-      time.sleep(0.0005)
-    #self.prlog('*==* getEvent: received event %i'%evNr)
-    if mode !=0: # received copy of the event data
-      return cQ.get()
-    else: # received pointer to event buffer
-      ibr = cQ.get()
-      evNr = self.trigStamp[ibr]
-      evTime = self.timeStamp[ibr]
-      evData = self.BMbuf[ibr]
-      return evNr, evTime, evData
+    return self.BMgetClient(client_index).getEvent(mode=mode)
+
+  def BMready(self, client_index):
+    '''signal readiness of client without requesting an event'''
+    self.BMgetClient(client_index).ready()
+
+  def BMwaitClients(self, timeout=10.):
+    '''
+    wait until all registered clients are ready, i.e. requested 
+      an event or called BMready()
+
+      Returns: list of clients not ready after timeout
+    '''
+    t0 = time.time()
+    while True:
+      active = self.activeClients()
+      waiting = list(active[self.clientTable[active, 2] == 0])
+      if not len(waiting): return []
+      if time.time() - t0 > timeout:
+        self.prlog('!=! BMwaitClients: clients %s not ready' % str(waiting))
+        return waiting
+      time.sleep(0.001)
+
+  def BMgetClient(self, client_index):
+    '''
+    light-weight handle for consumer processes (see module BMClient)
+
+      instead of the Buffer Manager instance, pass the handle to 
+      consumer processes; works with start methods 'fork', 'spawn' 
+      and 'forkserver'
+
+      Returns: BMClient
+    '''
+    if client_index not in self.clients:
+      self.clients[client_index] = BMClient(self, client_index)
+    return self.clients[client_index]
 
 #-- Run control fuctions
 # set-up Buffer Manager processes
@@ -342,14 +927,33 @@ class BufferMan(object):
     self.ACTIVE.value = True 
     self.runStarted = False
 
-    thr_acquireData=threading.Thread(target=self.acquireData)
-    thr_acquireData.setName('acquireData')
-    thr_acquireData.daemon=True
-    thr_acquireData.start()
-    self.thrds.append(thr_acquireData)
-# test: try as sub-process
-#    prc_acquireData=Process(name='acquireData', target=self.acquireData)
-#    prc_cquireData.start()
+    self.logQ = clientContext.Queue()
+    self.logger.setQueue(self.logQ)
+    if self.ProducerMode == 'process':
+    # producer as sub-process, isolated from code in main process 
+      self.prodCmd, prodConn = Pipe()
+      self.prodProc = Process(name='acquireData', target=self.mpProducer,
+                              args=(prodConn,) )
+      self.prodProc.start()
+      try: # wait for device initialised by producer
+        pars = self.prodCmd.recv() if self.prodCmd.poll(60.) else None
+      except EOFError:
+        pars = None
+      if pars is None or pars[1] != self.NSamples or \
+          pars[0] != self.TSampling:
+        print('!=! BufferMan: device not initialised by producer - exit')
+        self.ACTIVE.value = False
+        sys.exit(1)
+      self.DevConf.setSamplingPars(*pars) # configuration only, no device
+      if self.verbose:
+        print('      BufferMan: starting process ', self.prodProc.name, 
+              ' PID =', self.prodProc.pid)
+    else:
+      thr_acquireData=threading.Thread(target=self.acquireData)
+      thr_acquireData.setName('acquireData')
+      thr_acquireData.daemon=True
+      thr_acquireData.start()
+      self.thrds.append(thr_acquireData)
 
 #    thr_manageDataBuffer=threading.Thread(target=self.manageDataBuffer)
 #    thr_manageDataBuffer.setName('manageDataBuffer')
@@ -361,7 +965,6 @@ class BufferMan(object):
     self.start_manageDataBuffer = True
 
   # BufferMan Info and control  always started
-    self.logQ = Queue()
     maxBMrate = 450.
     self.BMIinterval = 1000.  # update interval in ms
     self.procs.append(Process(name='BufManCntrl',
@@ -373,17 +976,35 @@ class BufferMan(object):
 
   # waveform display 
     if 'mpOsci' in self.BMmodules: 
-      OScidx, OSmpQ = self.BMregister_mpQ()
+      OScidx, OSmpQ = self.BMregister_mpQ('Osci')
       self.procs.append(Process(name='Osci',
                               target = mpOsci, 
                               args=(OSmpQ, self.DevConf, 50., 'event rate') ) )
 #                                                     interval
+  # event server for remote consumers
+    if 'EvtServer' in self.BMmodules: 
+      EScidx = self.BMregister()
+      self.procs.append(Process(name='EvtServer',
+                              target = mpEvtServer, 
+                              args=(self, EScidx, self.DevConf.CRanges,
+                                    self.EvtServerPort, self.EvtServerHost,
+                                    self.EvtServerType) ) )
+  # recording of compressed events to file
+    if 'mpRecorder' in self.BMmodules: 
+      RCcidx = self.BMregister()
+      opts = dict(self.RecordCompression)
+      NWorkers = opts.pop('workers', 2)
+      self.procs.append(Process(name='Recorder',
+                              target = mpRecorder, 
+                              args=(self, RCcidx, self.RecordFile, NWorkers),
+                              kwargs=opts) )
 # start BufferMan background processes   
     for prc in self.procs:
 #      prc.deamon = True
       prc.start()
       if self.verbose:
         print('      BufferMan: starting process ', prc.name, ' PID =', prc.pid)
+      self.placeProcess(prc.name, prc.pid)
 #  end start()
 
 # start run - this must not be started before all clients have registred
@@ -393,6 +1014,22 @@ class BufferMan(object):
       self.prlog('*==* run already started - do nothing')
       return
 
+    if self.start_manageDataBuffer and len(self.roiQues): 
+    # extraction of regions of interest, if subscribers registered
+      ROIcidx = self.BMregister()
+    # obligatory consumer only for lossless subscribers, else random
+      ROImode = 0 if [l for Q, l in self.roiQues if l] else 1
+      self.procs.append(Process(name='ROIExtractor', 
+        target=mpROIExtractor, 
+        args=(self, ROIcidx, self.roiQues, 
+              int(self.NSamples * self.DevConf.pretrig), self.ROIWindow,
+              self.ROIThreshold, self.ROINsigma, ROImode) ) )
+      self.procs[-1].start()
+      if self.verbose:
+        print('      BufferMan: starting process ',
+             self.procs[-1].name, ' PID =', self.procs[-1].pid)
+      self.placeProcess(self.procs[-1].name, self.procs[-1].pid)
+
     if self.start_manageDataBuffer: # delayed start of manageDataBuffer
       self.procs.append(Process(name='manageDataBuffer', 
                                  target=self.manageDataBuffer) )
@@ -403,17 +1040,149 @@ class BufferMan(object):
              self.procs[-1].name, ' PID =', self.procs[-1].pid)
         
     tstart = time.time()
-    if self.LogFile:
-      datetime=time.strftime('%y%m%d-%H%M',time.gmtime(tstart))
-      self.flog = open(self.LogFile + '_' + datetime + '.log', 'w')
+    self.openLogFile(tstart)
 
     if self.verbose: self.prlog('*==* BufferMan T0')
     self.BMT0 = tstart
+    self.runT0.value = tstart
+    self.sendProducerCommand('T0', tstart)
     if self.verbose: self.prlog('*==* BufferMan start running')
 
     self.runStarted = True
     self.RUNNING.value = True  
 
+# start new run while data acquisition continues
+  def rollover(self, evNr=None, timeout=10.):
+    '''
+    new run without stopping the producer and the device
+
+      the run ends with the event before evNr; summary of the run is 
+      written and the log file rotated, per-run counters start from zero; 
+      the run number of events is seen by clients (BMClient.runOf(), 
+      BMClient.onRunChange())
+
+      Args:
+        evNr:    first event of new run, default: next event
+        timeout: maximum time (s) to wait for first event of new run
+
+      Returns: new run number, 0 if no new run
+    '''
+    if not self.RUNNING.value or self.STOPPED:
+      print('*==* BufferMan: Rollover command recieved, but not running')
+      return 0
+    start = self.runState()
+    first = self.Ntrig.value + 1
+    if evNr is not None: first = max(evNr, first)
+    self.runNext.value = first
+    t0 = time.time()
+    while self.runSeen.value == start['run']: # wait for first event of run
+      if not self.ACTIVE.value: return 0
+      if time.time() - t0 > timeout and \
+          self.runNumber.value == start['run']:
+        self.runNext.value = 0
+        time.sleep(0.01) # producer may be starting the run just now 
+        if self.runNumber.value == start['run']:
+          self.prlog('!=! BufferMan rollover: no event %i after %.1fs' 
+                     % (first, timeout) )
+          return 0
+      time.sleep(0.0005)
+    self.dTPause0 = self.dTPause
+    self.Nrestarts0 = self.Nrestarts
+    end = self.runState()
+    self.print_summary(start, end) # closes log file
+    self.openLogFile(end['T0'])
+    self.prlog('*==* BufferMan: run %i started with event %i' 
+               % (end['run'], end['first']) )
+    return end['run']
+
+  def reconfigure(self, changes, timeout=10.):
+    '''
+    change trigger or channel settings of the device during a run
+
+      the producer is held at an event boundary while the changes are
+      applied by the process owning the device; events are tagged 
+      with a configuration version, its channel ranges are seen by
+      clients (BMClient.configOf(), BMClient.onConfigChange())
+
+      Args:
+        changes: dict, keys from reconfigKeys, e.g. {'trgThr': -0.05}
+        timeout: maximum time (s) to wait for end of current event; 
+               a device waiting for a trigger is stopped, no event
+
+      Returns: new configuration version, 0 if not changed
+    '''
+    bad = [k for k in changes if k not in reconfigKeys]
+    if not hasattr(self.DevConf, 'reconfigure'): bad = list(changes)
+    for k in ('ChanRanges', 'ChanModes', 'ChanOffsets'):
+      if k in changes and len(changes[k]) != self.NChannels: bad.append(k)
+    if len(bad):
+      self.prlog('!=! BufferMan reconfigure: cannot change ' + str(bad))
+      return 0
+
+    wasRunning = self.RUNNING.value
+    self.RUNNING.value = False # producer waits before next event
+    self.reconfPending.value = True # ... and stops waiting for a trigger
+    t0 = time.time()
+    while not self.prodIdle.value:
+      if time.time() - t0 > timeout or not self.ACTIVE.value:
+        self.prlog('!=! BufferMan reconfigure: producer busy')
+        self.reconfPending.value = False
+        self.RUNNING.value = wasRunning
+        return 0
+      time.sleep(0.0005)
+    self.reconfPending.value = False # device re-armed with next event
+
+    if self.prodProc is not None: # device owned by producer process
+      self.reconfTag += 1 # late replies to earlier requests are discarded
+      self.sendProducerCommand('C', changes, self.reconfTag)
+      CRanges = None
+      while self.prodCmd.poll(timeout):
+        tag, r = self.prodCmd.recv()
+        if tag == self.reconfTag: 
+          CRanges = r
+          break
+        self.prlog('!=! BufferMan reconfigure: late reply to request %i'
+                   ' discarded' % tag)
+      if CRanges is not None:
+        for k in changes: setattr(self.DevConf, k, changes[k])
+        self.DevConf.CRanges = CRanges
+    else:
+      try:
+        CRanges = self.DevConf.reconfigure(changes)
+      except Exception as e:
+        self.prlog('!=! BufferMan reconfigure: ' + str(e))
+        CRanges = None
+    if CRanges is None:
+      self.prlog('!=! BufferMan reconfigure: device not configured')
+      self.RUNNING.value = wasRunning
+      return 0
+
+    v = self.confVersion.value + 1
+    first = self.Ntrig.value + 1
+    self.confRanges[v % NConfKept] = CRanges[:self.NChannels]
+    self.confTable[v % NConfKept] = (v, first)
+    self.confVersion.value = v # last, table entry complete for clients
+    self.prlog('*==* BufferMan: configuration %i from event %i: %s' 
+               % (v, first, str(changes)) )
+    self.RUNNING.value = wasRunning
+    return v
+
+  def runState(self):
+    '''Returns: counters at start of current run (see print_summary())'''
+    r = self.runNumber.value
+    return {'run': r, 'first': int(self.runTable[r % NRunsKept, 1]),
+            'T0': self.runT0.value, 'Tlife': self.runTlife0.value,
+            'dTPause': self.dTPause0, 'Nrestarts': self.Nrestarts0,
+            'stats': self.clientStats0.copy(), 
+            'Nreclaimed': self.Nreclaimed0.value}
+
+  def openLogFile(self, t):
+    if not self.LogFile: return
+    datetime=time.strftime('%y%m%d-%H%M',time.gmtime(t))
+    r = self.runNumber.value
+    self.logger.openFile(self.LogFile + '_' + datetime + 
+                         ('_run%i' % r if r > 1 else '') + '.log')
+
 # pause data acquisition - RUNNING flag evaluated by raw data producer
   def pause(self):
     if not self.RUNNING.value: 
@@ -441,6 +1210,73 @@ class BufferMan(object):
     self.dTPause += (time.time() - self.tPause)  
     self.tPause = 0.
 
+  def placeProcess(self, name, pid=0):
+    '''apply CPU set and priority from configuration and report placement
+
+       Args:
+         name: name of thread or process as used in configuration
+         pid:  process id, 0 for calling thread
+    '''
+    if not self.placement: return
+    if name in self.placement:
+      cpus, nice, rtprio = self.placement[name]
+    elif 'default' in self.placement:
+      cpus, nice, rtprio = self.placement['default']
+    else:
+      return
+    for e in setPlacement(cpus, nice, rtprio, pid):
+      self.prlog('!=! placement ' + name + ': ' + e)
+    if self.verbose:
+      self.prlog('*==* placement ' + name + ': ' + getPlacement(pid))
+
+  def watchProcess(self, prc, maxRestarts=None):
+    '''restart consumer process if it ends while the Buffer Manager is active
+
+       client slots used by the process are re-activated for the new process,
+       i.e. target and arguments of the process are used again
+
+       Args:
+         prc: ConsumerProcess, keeps target and arguments
+         maxRestarts: maximum number of restarts, default: RestartConsumers
+    '''
+    if maxRestarts is None: maxRestarts = self.RestartConsumers
+    if not hasattr(prc, 'spec'):
+      self.prlog('!=! watchProcess: ' + prc.name + 
+                 ' not restartable, needs ConsumerProcess')
+      return
+    self.watched.append([prc, maxRestarts])
+    if len(self.watched) == 1:
+      thr_watchdog = threading.Thread(target=self.watchdog)
+      thr_watchdog.setName('watchdog')
+      thr_watchdog.daemon = True
+      thr_watchdog.start()
+      self.thrds.append(thr_watchdog)
+
+  def watchdog(self):
+    '''thread in main process, restarts watched processes'''
+    while self.ACTIVE.value:
+      time.sleep(0.5)
+      for w in self.watched:
+        prc, nleft = w
+        if prc.pid is None or prc.is_alive() or not nleft \
+            or not self.ACTIVE.value: continue
+        prc.join()
+      # re-activate client slots of ended process
+        self.BMlock.acquire()
+        for i in np.nonzero(self.clientTable[:, 2] == prc.pid)[0]:
+          self.drainClientQues(i)
+          self.clientTable[i, 0] = 1
+          self.clientTable[i, 2] = 0 # PID set by new process
+        self.BMlock.release()
+        newprc = ConsumerProcess(*prc.spec)
+        newprc.start()
+        self.placeProcess(newprc.name, newprc.pid)
+        w[0], w[1] = newprc, nleft - 1
+        if prc in self.procs: self.procs[self.procs.index(prc)] = newprc
+        self.Nrestarts += 1
+        self.prlog('!=! BufferMan: process %s (PID %i) ended, restarted as PID %i'
+                   % (prc.name, prc.pid, newprc.pid) )
+
   def setverbose(self, vlevel):
     self.verbose = vlevel
 
@@ -457,6 +1293,10 @@ class BufferMan(object):
         self.stop()    
       elif cmd == 'E': 
         self.end()    
+      elif cmd == 'N': 
+        self.rollover()    
+      elif cmd[0] == 'C': # ('C', dict of changes)
+        self.reconfigure(cmd[1])
       time.sleep(0.02)
 
   def getBMCommandQue(self):
@@ -525,31 +1365,62 @@ class BufferMan(object):
         Q.put( self.getStatus()) 
       time.sleep(self.BMIinterval/2000.) # ! convert from ms to s
 
-  def prlog(self, m):
-    ''' send a Message, to screen or to LogQ'''
+  def prlog(self, m, level=None, key=None):
+    ''' send a Message, to screen, LogQ and log file (see BMlogger)
+
+        level: DEBUG, INFO, WARNING or ERROR, 
+               default ERROR for messages starting with '!', else INFO
+        key:   identifies similar messages for rate limiting, 
+               default: beginning of message without numbers
+    '''
+    if level is None: level = ERROR if m[:1] == '!' else INFO
+    if level < self.logger.level: return # fast exit
     t = time.time() - self.BMT0 # add time stamp to message
-    s = '%.2f '%(t) + m  
-    if self.logQ is None:
-      print(s)
-    else:
-      if self.logQ.empty(): 
-        self.logQ.put(s)
-      else:
-        print(s)
-    if self.flog != None:
-      print(s, file = self.flog)
+    self.logger.log('%.2f '%(t) + m, level, 
+                    messageKey(m) if key is None else key)
 
 # prints end-of-run summary      
-  def print_summary(self):
-    datetime=time.strftime('%y%m%d-%H%M',time.gmtime(self.BMT0))
-    if self.flog == None:
-      self.flog = open('BMsummary_' + datetime+'.sum', 'w')
-    self.prlog('Run Summary: started ' + datetime)
+  def print_summary(self, start, end):
+    '''summary of run from counters at start and end (see runState())'''
+    datetime=time.strftime('%y%m%d-%H%M',time.gmtime(start['T0']))
+    if self.logger.f is None:
+      self.logger.openFile('BMsummary_' + datetime + 
+         ('_run%i' % start['run'] if start['run'] > 1 else '') + '.sum')
+    lvl = max(self.logger.level, INFO) # summary always written
+    self.prlog('Run Summary: run %i started ' % start['run'] + datetime, lvl)
     self.prlog('  Trun=%.1fs  Ntrig=%i  Tlife=%.1fs\n'\
-          %(self.TStop - self.BMT0 - self.dTPause, 
-            self.Ntrig.value, self.Tlife.value) )
-    self.flog.close()
-    self.flog = None
+          %(end['T0'] - start['T0'] - (end['dTPause'] - start['dTPause']), 
+            end['first'] - start['first'], end['Tlife'] - start['Tlife']),
+          lvl )
+    stats = end['stats'] - start['stats']
+    for i in range(self.NSlotsUsed.value):
+      self.prlog('  client %i (%s): delivered %i  skipped %i  missed %i'\
+                 '  rejected %i'\
+          %((i, self.getClientPolicy(i)[0]) + tuple(stats[i])), lvl )
+    Nreclaimed = end['Nreclaimed'] - start['Nreclaimed']
+    Nrestarts = end['Nrestarts'] - start['Nrestarts']
+    if Nreclaimed or Nrestarts:
+      self.prlog('  events reclaimed from dead clients: %i  restarts: %i'\
+          %(Nreclaimed, Nrestarts), lvl )
+    self.logger.closeFile()
+
+  def drainBuffers(self, timeout=10.):
+    '''wait until producer is idle and all events in the buffer
+       were released by manageDataBuffer (i.e. seen by clients)
+
+       Returns: number of events flushed, -1 after timeout
+    '''
+    n0 = self.Ndone.value
+    t0 = time.time()
+    while not (self.prodIdle.value and self.Ndone.value >= self.Ntrig.value):
+      if not self.ACTIVE.value or self.start_manageDataBuffer: 
+        return 0 # no manageDataBuffer
+      if time.time() - t0 > timeout:
+        self.prlog('!=! drainBuffers: timeout, %i events not released'
+                   % (self.Ntrig.value - self.Ndone.value) )
+        return -1
+      time.sleep(0.0005)
+    return self.Ndone.value - n0
 
 # put run in "stopped state" - BM processes remain active, no resume possible    
   def stop(self):
@@ -566,21 +1437,38 @@ class BufferMan(object):
 
     self.TStop = time.time()
     self.STOPPED = True
+    start = self.runState()
 
-    time.sleep(1.) # allow all events to propagate 
+    # barrier: events still in the buffer are passed to clients
+    t0 = time.time()
+    Nflushed = self.drainBuffers()
+    if self.verbose and Nflushed >= 0: 
+      self.prlog('*==* BufferMan stop: %i events flushed in %.3fs' 
+                 % (Nflushed, time.time() - t0) )
 
     if self.verbose: 
       self.prlog('*==* BufferMan endig - reached stopped state')
-    self.print_summary()
+    end = {'run': start['run'], 'first': self.Ntrig.value + 1,
+           'T0': self.TStop, 'Tlife': self.Tlife.value,
+           'dTPause': self.dTPause, 'Nrestarts': self.Nrestarts,
+           'stats': self.clientStats.copy(), 
+           'Nreclaimed': self.Nreclaimed.value}
+    self.print_summary(start, end)
     if self.verbose: 
       print('\n *==* BufferMan ending, RunSummary written')
-      print('  Run Summary: Trun=%.1fs  Ntrig=%i  Tlife=%.1fs\n'\
-            %(self.TStop - self.BMT0-self.dTPause, 
-              self.Ntrig.value, self.Tlife.value) )
+      print('  Run Summary: run %i  Trun=%.1fs  Ntrig=%i  Tlife=%.1fs\n'\
+            %(start['run'], 
+              self.TStop - start['T0'] - (self.dTPause - start['dTPause']), 
+              end['first'] - start['first'], 
+              self.Tlife.value - start['Tlife']) )
 
  # end BufferManager, stop all processes
  #       ACTIVE flag observed by all sub-processes     
-  def end(self):
+  def end(self, timeout=5.):
+    '''end Buffer Manager: stop run, end all sub-processes
+
+       Args: timeout: maximum time (s) to wait for sub-processes
+    '''
     if not self.ACTIVE.value:
       print('*==* BufferMan: End command recieved, but not active')
       return
@@ -589,13 +1477,19 @@ class BufferMan(object):
       self.stop()
 
     self.ACTIVE.value = False 
-    time.sleep(0.3)
-
-  # stop all sub-processes
+    if self.prodProc is not None: # producer closes device before ending
+      self.prodProc.join(5.)
+  # sub-processes observe ACTIVE and end, e.g. recorder writes pending
+  #   events; displays and processes not ending in time are terminated
+    tend = time.time() + timeout
+    for prc in self.procs:
+      if prc.name not in displayProcs: 
+        prc.join(max(tend - time.time(), 0.) )
     for prc in self.procs:
-      if self.verbose: print('    BufferMan: terminating ' + prc.name)
-      prc.terminate()
-    time.sleep(0.3)
+      if prc.is_alive():
+        if self.verbose: print('    BufferMan: terminating ' + prc.name)
+        prc.terminate()
+        prc.join(1.)
 
   def __del__(self):
     self.RUNNING.value = False
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''
+.. module EvtServer of picoDAQ
+
+   stream BufferMan events to remote consumers over TCP
+
+   protocol (all numbers little-endian):
+
+     client -> server:
+       subscribe:  b'PDQS', mode (uint8, 0: sampled, 1: lossless),
+                   initial credit (uint32)
+       credit:     b'PDQC', number of additional events (uint32)
+
+     server -> client, one frame per event:
+       header:     b'PDQE', evNr (uint32), evTime (float64),
+                   NChannels (uint16), NSamples (uint32),
+                   data type (uint8, 0: float32, 1: int16, 2: compressed)
+       scales:     NChannels x float32 (int16 only, Volt per count)
+       payload:    NChannels x NSamples raw values, or
+                   length (uint32) and event compressed with
+                   compressEvent() of module evtCompress
+
+   a client receives an event only if it has credit left; sampled
+   clients miss events otherwise, lossless clients stall the
+   server, and hence data acquisition, until credit is granted
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys, socket, select, struct, threading
+
+from .evtCompress import compressEvent, decompressEvent, scalesFromRanges
+
+HDR = struct.Struct(str('<4sIdHIB'))
+SUB = struct.Struct(str('<4sBI'))
+CRD = struct.Struct(str('<4sI'))
+dtypes = {'float32': 0, 'int16': 1, 'compressed': 2}
+
+def packEvent(evNr, evTime, evData, dtype=0, scales=None):
+  '''encode event as a frame
+
+     Args:
+       evNr, evTime, evData: event as provided by BufferMan.getEvent()
+       dtype:  0 for float32, 1 for int16, 2 for compressed
+       scales: Volt per ADC count for each channel (int16, compressed)
+
+     Returns: bytes
+  '''
+  NChannels, NSamples = evData.shape
+  hdr = HDR.pack(b'PDQE', int(evNr), evTime, NChannels, NSamples, dtype)
+  if dtype == 2:
+    blob = compressEvent(evData, scales)
+    return hdr + struct.pack(str('<I'), len(blob)) + blob
+  if dtype == 1:
+    cnts = np.round(evData / scales[:, None]).clip(-32767, 32767)
+    return hdr + scales.astype('<f4').tobytes() + cnts.astype('<i2').tobytes()
+  return hdr + evData.astype('<f4').tobytes()
+
+def recvExact(sock, n):
+  '''receive exactly n bytes from socket, None if connection closed'''
+  buf = b''
+  while len(buf) < n:
+    try:
+      b = sock.recv(n - len(buf))
+    except socket.error: # e.g. connection reset by peer
+      return None
+    if not b: return None
+    buf += b
+  return buf
+
+class EvtServer(object):
+  '''serve events of a BufferMan client to remote subscribers'''
+
+  def __init__(self, BM, cId, CRanges, port=5500, host='localhost',
+               dtype='float32'):
+    '''Args:
+         BM:      Buffer Manager instance
+         cId:     client id from BM.BMregister()
+         CRanges: channel ranges, for conversion to int16
+         port:    TCP port
+         host:    interface to listen on ('' for all)
+         dtype:   transport data type, 'float32', 'int16' or 'compressed'
+    '''
+    self.BM = BM
+    self.cId = cId
+    self.port = port
+    self.host = host
+    self.dtype = dtypes[dtype]
+    self.scales = scalesFromRanges(CRanges)
+    self.clients = {} # socket -> [mode, credit]
+    self.lock = threading.Condition()
+    self.Nsent = 0
+
+  def serveSockets(self, lsock):
+    '''accept connections and read subscriptions and credits'''
+    socks = [lsock]
+    while self.BM.ACTIVE.value:
+      r, w, x = select.select(socks, [], [], 0.1)
+      for s in r:
+        if s is lsock:
+          c, addr = lsock.accept()
+          socks.append(c)
+          continue
+        msg = recvExact(s, CRD.size)
+        if msg is not None and msg[:4] == b'PDQS':
+          rest = recvExact(s, SUB.size - CRD.size)
+          msg = None if rest is None else msg + rest
+        self.lock.acquire()
+        if msg is None:                       # connection closed
+          socks.remove(s)
+          self.clients.pop(s, None)
+          s.close()
+        elif msg[:4] == b'PDQS':
+          tag, mode, credit = SUB.unpack(msg)
+          self.clients[s] = [mode, credit]
+          self.BM.prlog('*==* EvtServer: new %s subscriber' %
+                        ('lossless' if mode else 'sampled') )
+        elif msg[:4] == b'PDQC' and s in self.clients:
+          self.clients[s][1] += CRD.unpack(msg)[1]
+        self.lock.notify_all()
+        self.lock.release()
+    for s in socks: s.close()
+
+  def setScales(self, version, firstEvNr, CRanges):
+    '''channel ranges changed, see BufferMan.reconfigure()'''
+    self.scales = scalesFromRanges(CRanges)
+
+  def sendTo(self, s, frame):
+    try:
+      s.sendall(frame)
+      self.clients[s][1] -= 1
+    except socket.error:
+      self.clients.pop(s, None) # reader thread closes socket
+
+  def run(self):
+    lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    lsock.bind( (self.host, self.port) )
+    lsock.listen(5)
+    thr = threading.Thread(target=self.serveSockets, args=(lsock,) )
+    thr.daemon = True
+    thr.start()
+    self.BM.BMready(self.cId) # events requested only with subscribers
+    self.BM.BMgetClient(self.cId).onConfigChange(self.setScales)
+
+    while self.BM.ACTIVE.value:
+      # no event is taken and packed unless a subscriber will get it
+      self.lock.acquire()
+      lossless = [s for s in self.clients if self.clients[s][0] == 1]
+      ready = len(lossless) or \
+        [s for s in self.clients if self.clients[s][1] > 0]
+      if not ready: self.lock.wait(0.1) # for subscription or credit
+      self.lock.release()
+      if not ready: continue
+      # obligatory consumer only if lossless subscribers are connected
+      e = self.BM.getEvent(self.cId, mode = 0 if len(lossless) else 1)
+      if e is None: break
+      frame = packEvent(e[0], e[1], e[2], self.dtype, self.scales)
+      self.lock.acquire()
+      for s in list(self.clients):
+        if s not in self.clients: continue
+        mode, credit = self.clients[s]
+        if mode == 1: # wait for credit of lossless subscriber
+          while s in self.clients and self.clients[s][1] <= 0 \
+                and self.BM.ACTIVE.value:
+            self.lock.wait(0.1)
+          if s in self.clients: self.sendTo(s, frame)
+        elif credit > 0:
+          self.sendTo(s, frame)
+      self.lock.release()
+      self.Nsent += 1
+    thr.join(1.)
+
+def mpEvtServer(BM, cId, CRanges, port=5500, host='localhost',
+                dtype='float32'):
+  '''run EvtServer as sub-process, arguments as for class EvtServer'''
+  try:
+    EvtServer(BM, cId, CRanges, port, host, dtype).run()
+  except Exception as e:
+    print('*==* mpEvtServer: ' + str(e))
+  sys.exit()
+
+class EvtClient(object):
+  '''receive events from EvtServer
+
+     usage:
+       C = EvtClient('daqpc', 5500, mode='lossless')
+       while True:
+         evNr, evTime, evData = C.getEvent()
+  '''
+
+  def __init__(self, host='localhost', port=5500, mode='sampled', credit=4):
+    '''Args:
+         host, port: address of EvtServer
+         mode:   'sampled' or 'lossless'
+         credit: number of events in flight
+    '''
+    self.sock = socket.create_connection( (host, port) )
+    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    self.sock.sendall(SUB.pack(b'PDQS', 1 if mode == 'lossless' else 0,
+                               credit) )
+
+  def getEvent(self):
+    '''Returns: evNr, evTime, evData, or None if connection closed'''
+    hdr = recvExact(self.sock, HDR.size)
+    if hdr is None: return None
+    tag, evNr, evTime, NChannels, NSamples, dtype = HDR.unpack(hdr)
+    # connection may be closed within a frame
+    if dtype == 2:
+      n = recvExact(self.sock, 4)
+      z = None if n is None else \
+        recvExact(self.sock, struct.unpack(str('<I'), n)[0])
+      if z is None: return None
+      evData = decompressEvent(z)
+    elif dtype == 1:
+      scales = recvExact(self.sock, 4*NChannels)
+      cnts = None if scales is None else \
+        recvExact(self.sock, 2*NChannels*NSamples)
+      if cnts is None: return None
+      evData = np.frombuffer(cnts, '<i2').reshape(NChannels, NSamples) \
+        * np.frombuffer(scales, '<f4')[:, None]
+    else:
+      d = recvExact(self.sock, 4*NChannels*NSamples)
+      if d is None: return None
+      evData = np.frombuffer(d, '<f4').reshape(NChannels, NSamples)
+    try:
+      self.sock.sendall(CRD.pack(b'PDQC', 1)) # return credit
+    except socket.error:
+      return None
+    return evNr, evTime, evData
+
+  def close(self):
+    self.sock.close()
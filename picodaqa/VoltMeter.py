@@ -128,12 +128,18 @@ class VoltMeter(object):
     k=n%self.Npoints
     txt_t='Time  %.1fs' %(evTime)            
     txt=[]
+  # effective voltage and standard deviation of all channels in one pass
+    NS = evData.shape[1]
+    Vsq = np.einsum('ij,ij->i', evData, evData, dtype=np.float64) / NS
+    Vmean = evData.sum(axis=1, dtype=np.float64) / NS
+    Veff = np.sqrt(Vsq)
+    stdV = np.sqrt(np.maximum(Vsq - Vmean * Vmean, 0.))
     for i, C in enumerate(self.picoChannels):
       if i > 1: 
         break  # works for 2 channels only
-      self.V[i] = np.sqrt (np.inner(evData[i], evData[i])/len(evData[i]) )
+      self.V[i] = Veff[i]
       self.Vhist[i, k] = self.V[i]
-      self.stdV[i] = evData[i].std()
+      self.stdV[i] = stdV[i]
       self.stdVhist[i, k] = self.stdV[i]
     # update history graph
       if n>1: # !!! fix to avoid permanent display of first object in blit mode
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+.. module asyncBMClient of picoDAQ
+
+   asyncio interface for BufferMan consumers (python 3 only)
+
+   many consumers (monitors, writers, network forwarders) can run as
+   coroutines in one light-weight process instead of one process each;
+   waiting for events costs no polling, the event loop is woken up by
+   the file descriptor of the delivery channel (class ShmChannel)
+
+   usage (registration before BM.run(), in the main process):
+
+     abm = AsyncBMClient(BM)
+     cId1 = abm.register()                  # obligatory consumer
+     cId2 = abm.register(policy='lag')
+
+     async def monitor(cId):
+       async for evNr, evTime, evData in abm.subscribe(cId, mode=1):
+         ...
+
+     def consumers():                       # runs as sub-process
+       abm.run(monitor(cId1), monitor(cId2))
+
+     procs.append(mp.Process(name='asyncConsumers', target=consumers))
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import asyncio
+
+class AsyncBMClient(object):
+  '''host BufferMan consumers as asyncio coroutines'''
+
+  def __init__(self, BM):
+    '''Args: BM: Buffer Manager instance'''
+    self.BM = BM
+
+  def register(self, **kwargs):
+    '''register a client with a file-descriptor based delivery channel
+
+       Args: as for BufferMan.BMregister()
+       Returns: client index
+    '''
+    return self.BM.BMregister(channel='shm', **kwargs)
+
+  async def waitReadable(self, fd, timeout=0.5):
+    '''wait until fd is readable, returns False after timeout'''
+    loop = asyncio.get_event_loop()
+    fut = loop.create_future()
+    loop.add_reader(fd, lambda: fut.done() or fut.set_result(True) )
+    try:
+      return await asyncio.wait_for(fut, timeout)
+    except asyncio.TimeoutError:
+      return False
+    finally:
+      loop.remove_reader(fd)
+
+  async def subscribe(self, cId, mode=1):
+    '''asynchronous generator of events
+
+       Args:
+         cId:  client index from register()
+         mode: request mode as for BufferMan.getEvent()
+
+       Yields: evNr, evTime, evData
+    '''
+    BM = self.BM
+    cQ = BM.consumer_Ques[cId]
+    BM.BMready(cId)
+    while BM.ACTIVE.value:
+      BM.request_Ques[cId].put(mode)
+      while not await self.waitReadable(cQ.fileno()):
+        if not BM.ACTIVE.value: return
+      e = cQ.get()
+      if isinstance(e, tuple): # received copy of the event data
+        yield e
+      else:                    # received pointer to event buffer
+        yield BM.trigStamp[e], BM.timeStamp[e], BM.BMbuf[e]
+
+  def run(self, *coros):
+    '''run coroutines until all of them are finished'''
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+      loop.run_until_complete(asyncio.gather(*coros))
+    finally:
+      loop.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+'''
+.. module baselineTracker of picoDAQ
+
+   running baseline and noise level per channel
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+from multiprocessing.sharedctypes import RawValue, RawArray
+
+class BaselineTracker(object):
+  '''running baseline and noise RMS per channel
+
+     updated from the pre-trigger region of each event by the
+     Buffer Manager; values are in shared memory, i.e. visible
+     to all processes forked after creation
+
+     running mean of the first 1/alpha events, exponentially
+     weighted moving average (EWMA) with weight alpha thereafter,
+     i.e. values follow slow drifts
+  '''
+
+  def __init__(self, NChannels, NBaseline, alpha=0.02):
+    '''Args:
+         NChannels: number of channels
+         NBaseline: number of samples in pre-trigger region
+         alpha:     weight of new event in EWMA
+    '''
+    self.NBaseline = max(NBaseline, 2)
+    self.alpha = alpha
+    self.Cbaseline = RawArray('d', NChannels)
+    self.baseline = np.frombuffer(self.Cbaseline, 'd')
+    self.Cvariance = RawArray('d', NChannels)
+    self.variance = np.frombuffer(self.Cvariance, 'd')
+    self.Nupdates = RawValue('i', 0)
+
+  def update(self, evData):
+    '''add pre-trigger region of event (NChannels, NSamples)'''
+    pre = evData[:, :self.NBaseline]
+    m = pre.mean(axis=1, dtype=np.float64)
+    v = np.einsum('ij,ij->i', pre, pre, dtype=np.float64) / pre.shape[1] \
+         - m * m                  # mean and variance in one pass
+    self.Nupdates.value += 1
+    w = max(self.alpha, 1. / self.Nupdates.value)
+    self.baseline += w * (m - self.baseline)
+    self.variance += w * (np.maximum(v, 0.) - self.variance)
+
+  def rms(self):
+    '''noise RMS per channel'''
+    return np.sqrt(self.variance)
+
+  def threshold(self, Nsigma):
+    '''amplitude threshold per channel w.r.t. baseline'''
+    return Nsigma * self.rms()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+'''
+.. module consumerGroup of picoDAQ
+
+   work sharing between several consumer processes
+
+   workers registered with the same group name receive disjoint sets
+   of events; their results are merged in event order by a collector:
+
+     resultQ = mp.Queue()
+     for i in range(NWorkers):
+       cId = BM.BMregister(group='pulse')
+       procs.append(mp.Process(target=worker, args=(BM, cId, resultQ)))
+         # worker: resultQ.put( (evNr, result) ) for each event,
+         #         resultQ.put(None) when done
+     ...
+     C = OrderedCollector(resultQ, NWorkers)
+     for evNr, result in C:
+       ...
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import time, heapq, sys
+if sys.version_info[0] < 3:
+  import Queue as queue
+else:
+  import queue
+
+class OrderedCollector(object):
+  '''merge results of a consumer group in order of event number
+
+     results arrive out of order; a result is held back until all
+     earlier events are complete, or until more than maxHold results
+     are waiting or the oldest waited longer than timeout (events
+     may be missing, e.g. reclaimed from a dead worker)
+  '''
+
+  def __init__(self, Q, NWorkers, maxHold=64, timeout=2., firstEvNr=1):
+    '''Args:
+         Q:        multiprocessing Queue with (evNr, result) from workers,
+                   None from each worker at end
+         NWorkers: number of workers
+         maxHold:  maximum number of results held back
+         timeout:  maximum time (s) a result is held back
+         firstEvNr: number of first event
+    '''
+    self.Q = Q
+    self.NActive = NWorkers
+    self.maxHold = maxHold
+    self.timeout = timeout
+    self.heap = []  # (evNr, time of arrival, result)
+    self.next = firstEvNr # next expected event number
+    self.Nmissing = 0
+
+  def ready(self):
+    if not len(self.heap): return False
+    evNr, t, r = self.heap[0]
+    return evNr <= self.next or self.NActive == 0 or \
+       len(self.heap) > self.maxHold or time.time() - t > self.timeout
+
+  def get(self):
+    '''Returns: next (evNr, result) in order, None if all workers ended'''
+    while not self.ready():
+      if self.NActive == 0: return None
+      try:
+        item = self.Q.get(timeout=0.1)
+      except queue.Empty:
+        continue
+      if item is None:
+        self.NActive -= 1
+      else:
+        heapq.heappush(self.heap, (item[0], time.time(), item[1]) )
+    evNr, t, r = heapq.heappop(self.heap)
+    if evNr > self.next:
+      self.Nmissing += evNr - self.next
+    self.next = evNr + 1
+    return evNr, r
+
+  def __iter__(self):
+    while True:
+      item = self.get()
+      if item is None: return
+      yield item
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''
+.. module eventFilter of picoDAQ
+
+   declarative event filters, evaluated by the Buffer Manager before
+   an event is handed to a client; rejected events are not delivered,
+   i.e. the client is not woken up for uninteresting events
+
+   usage:
+
+     f = EventFilter()
+     f.require(1, 251, below=-0.04)  # sample 251 of channel 1 < -40 mV
+     f.require(2, 251, above=-0.01)
+       # or, equivalently, as numpy expression of event data d:
+     f = EventFilter('(d[1,251] < -0.04) & (d[2,251] > -0.01)')
+
+     cId = BM.BMregister(evFilter=f)
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np
+
+# cut: channel, sample window [first, last), statistic, threshold, sign
+#      (+1: statistic above threshold, -1: below)
+CUT = np.dtype([('chan', '<i4'), ('first', '<i4'), ('last', '<i4'),
+                ('stat', '<i4'), ('thr', '<f4'), ('sign', '<i4')])
+stats = ['min', 'max', 'mean']
+# name space of expressions, no builtins
+evalGlobals = {'__builtins__': {}, 'np': np}
+# array methods of numpy >= 2 import their implementation on first call,
+#   which needs builtins: done here, not within expressions
+_a = np.zeros(2, dtype=np.float32)
+for _m in ('min', 'max', 'mean', 'sum', 'prod', 'std', 'var', 'any', 'all'):
+  getattr(_a, _m)()
+_a.clip(0., 1.)
+del _a, _m
+
+class EventFilter(object):
+  '''accept events by thresholds in sample windows and/or an expression
+
+     all cuts must be passed (mode 'all') or at least one (mode 'any');
+     an expression must be passed in addition
+  '''
+
+  def __init__(self, expression=None, mode='all'):
+    '''Args:
+         expression: numpy expression of event data d (NChannels, NSamples),
+                     e.g. 'd[0].min() < -0.05'
+         mode:       'all' or 'any' cut must be passed
+    '''
+    if mode not in ('all', 'any'):
+      raise ValueError('EventFilter: invalid mode ' + str(mode))
+    self.expression = expression
+    self.mode = mode
+    self.cuts = np.zeros(0, dtype=CUT)
+    self.code = None # compiled expression, not picklable
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['code'] = None
+    return state
+
+  def require(self, chan, first, last=None, below=None, above=None,
+              stat=None):
+    '''add cut on samples [first, last) of channel chan
+
+       Args:
+         chan:   channel index
+         first:  first sample of window
+         last:   end of window, single sample if None
+         below:  threshold (Volt), statistic must be below
+         above:  threshold (Volt), statistic must be above
+         stat:   'min', 'max' or 'mean' of window; default 'min' for
+                 below and 'max' for above, i.e. any sample crossing
+                 the threshold
+
+       Returns: self, i.e. calls may be chained
+    '''
+    if last is None: last = first + 1
+    for thr, sign, dflt in ((below, -1, 'min'), (above, 1, 'max')):
+      if thr is None: continue
+      s = dflt if stat is None else stat
+      if s not in stats:
+        raise ValueError('EventFilter: invalid statistic ' + str(s))
+      self.cuts = np.append(self.cuts,
+          np.array([(chan, first, last, stats.index(s), thr, sign)],
+                   dtype=CUT) )
+    return self
+
+  def accept(self, evData):
+    '''Returns: True if event data (NChannels, NSamples) pass the filter'''
+    if len(self.cuts):
+      passed = (self.cutValues(evData) - self.cuts['thr']) \
+                * self.cuts['sign'] > 0.
+      if not (passed.all() if self.mode == 'all' else passed.any()):
+        return False
+    if self.expression is not None:
+      if self.code is None:
+        self.code = compile(self.expression, '<EventFilter>', 'eval')
+      return bool(eval(self.code, evalGlobals, {'d': evData}) )
+    return True
+
+  def cutValues(self, evData):
+    '''statistic of each cut window'''
+    v = np.empty(len(self.cuts), dtype=np.float32)
+    for k, c in enumerate(self.cuts):
+      w = evData[c['chan'], c['first']:c['last']]
+      v[k] = w.min() if c['stat'] == 0 else \
+             w.max() if c['stat'] == 1 else w.mean()
+    return v
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+'''
+.. module evtCompress of picoDAQ
+
+   compression of events for recording and network transport
+
+     - quantisation to int16 ADC counts, scale from channel ranges
+     - delta encoding of consecutive samples
+     - general-purpose codec: zlib, or lz4 if installed
+     - optional zero-suppression: only windows around samples
+       deviating from the baseline by more than a threshold are kept
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, struct, zlib
+from multiprocessing import Pool
+try:
+  import lz4.frame
+  have_lz4 = True
+except ImportError:
+  have_lz4 = False
+
+# header: tag, NChannels, NSamples, delta flag, zero-suppression flag, codec
+ZHDR = struct.Struct(str('<4sHIBBB'))
+codecs = {'none': 0, 'zlib': 1, 'lz4': 2}
+WIN = np.dtype([(str('chan'), '<u2'), (str('start'), '<u4'),
+                (str('len'), '<u4')])
+
+def scalesFromRanges(CRanges):
+  '''Volt per ADC count for int16 quantisation of channel ranges'''
+  return np.array(CRanges, dtype=np.float32) / 32767.
+
+def findWindows(evData, baselines, threshold, window):
+  '''find regions of samples deviating from baseline by more than threshold
+
+     Args:
+       evData:    event data (NChannels, NSamples)
+       baselines: baseline per channel
+       threshold: threshold, scalar or one value per channel
+       window:    (samples before, samples after) to keep around regions
+
+     Returns: structured array of windows (chan, start, len)
+  '''
+  NSamples = evData.shape[1]
+  over = np.abs(evData - baselines[:, None]) > np.reshape(threshold, (-1, 1))
+  # extend regions by window, by shifting edges of regions
+  edges = np.diff(over.astype(np.int8), axis=1, prepend=0, append=0)
+  ch_s, starts = np.nonzero(edges == 1)
+  ch_e, ends = np.nonzero(edges == -1)
+  starts = np.maximum(starts - window[0], 0)
+  ends = np.minimum(ends + window[1], NSamples)
+  # merge overlapping windows on the same channel
+  wins = []
+  for c, s, e in zip(ch_s, starts, ends):
+    if len(wins) and wins[-1][0] == c and s <= wins[-1][1] + wins[-1][2]:
+      wins[-1][2] = max(wins[-1][2], e - wins[-1][1])
+    else:
+      wins.append([c, s, e - s])
+  return np.array([tuple(w) for w in wins], dtype=WIN)
+
+def compressEvent(evData, scales, delta=True, codec='zlib',
+                  zsThreshold=None, zsWindow=(20, 100), level=1):
+  '''compress event data
+
+     Args:
+       evData:      event data (NChannels, NSamples) in Volt
+       scales:      Volt per ADC count for each channel
+       delta:       apply delta encoding
+       codec:       'none', 'zlib' or 'lz4'
+       zsThreshold: threshold (Volt) for zero-suppression, None: off
+       zsWindow:    samples kept before and after regions above threshold
+       level:       compression level
+
+     Returns: bytes
+  '''
+  NChannels, NSamples = evData.shape
+  cnts = np.round(evData / scales[:, None]).clip(-32767, 32767).astype('<i2')
+  parts = [scales.astype('<f4').tobytes()]
+  if zsThreshold is not None:
+    baselines = np.median(cnts, axis=1).astype('<i2')
+    wins = findWindows(cnts, baselines, zsThreshold / scales, zsWindow)
+    parts += [baselines.tobytes(), struct.pack(str('<I'), len(wins)),
+              wins.tobytes()]
+    segs = [cnts[w['chan'], w['start']:w['start'] + w['len']] for w in wins]
+  else:
+    segs = list(cnts)
+  if delta:
+    segs = [np.diff(sg, prepend=np.int16(0)) for sg in segs]
+  raw = np.concatenate(segs).astype('<i2').tobytes() if len(segs) else b''
+  if codec == 'lz4' and not have_lz4: codec = 'zlib'
+  if codec == 'zlib':
+    raw = zlib.compress(raw, level)
+  elif codec == 'lz4':
+    raw = lz4.frame.compress(raw)
+  hdr = ZHDR.pack(b'PDQZ', NChannels, NSamples, int(delta),
+                  int(zsThreshold is not None), codecs[codec])
+  return hdr + b''.join(parts) + raw
+
+def decompressEvent(blob):
+  '''inverse of compressEvent
+
+     Returns: event data (NChannels, NSamples), float32 Volt;
+              zero-suppressed samples are set to the baseline
+  '''
+  tag, NChannels, NSamples, delta, zs, codec = ZHDR.unpack_from(blob)
+  pos = ZHDR.size
+  scales = np.frombuffer(blob, '<f4', NChannels, pos)
+  pos += 4 * NChannels
+  if zs:
+    baselines = np.frombuffer(blob, '<i2', NChannels, pos)
+    pos += 2 * NChannels
+    nwin = struct.unpack_from(str('<I'), blob, pos)[0]
+    pos += 4
+    wins = np.frombuffer(blob, WIN, nwin, pos)
+    pos += WIN.itemsize * nwin
+  raw = blob[pos:]
+  if codec == codecs['zlib']:
+    raw = zlib.decompress(raw)
+  elif codec == codecs['lz4']:
+    raw = lz4.frame.decompress(raw)
+  vals = np.frombuffer(raw, '<i2')
+  if zs:
+    cnts = np.repeat(baselines[:, None], NSamples, axis=1)
+    i = 0
+    for w in wins:
+      sg = vals[i:i + w['len']]
+      if delta: sg = np.cumsum(sg, dtype=np.int16)
+      cnts[w['chan'], w['start']:w['start'] + w['len']] = sg
+      i += w['len']
+  else:
+    cnts = vals.reshape(NChannels, NSamples)
+    if delta: cnts = np.cumsum(cnts, axis=1, dtype=np.int16)
+  return (cnts * scales[:, None]).astype(np.float32)
+
+class EvtCompressor(object):
+  '''compress events in a pool of worker processes, results in order'''
+
+  def __init__(self, scales, NWorkers=2, maxPending=8, **kwargs):
+    '''Args:
+         scales:     Volt per ADC count for each channel
+         NWorkers:   number of worker processes
+         maxPending: maximum number of events in the pool
+         kwargs:     options for compressEvent()
+    '''
+    self.scales = scales
+    self.kwargs = kwargs
+    self.maxPending = maxPending
+    self.pool = Pool(NWorkers)
+    self.pending = []
+
+  def submit(self, evNr, evTime, evData):
+    '''submit event; evData are pickled to the workers in the
+       background and must not be modified, i.e. pass a copy
+
+       Returns: list of (evNr, evTime, compressed event) ready, in order
+    '''
+    self.pending.append( (evNr, evTime, self.pool.apply_async(compressEvent,
+                          (evData, self.scales), self.kwargs) ) )
+    done = []
+    while len(self.pending) and (self.pending[0][2].ready() or
+                                 len(self.pending) > self.maxPending):
+      n, t, r = self.pending.pop(0)
+      done.append( (n, t, r.get()) )
+    return done
+
+  def flush(self):
+    '''Returns: all remaining compressed events, in order'''
+    done = [(n, t, r.get()) for n, t, r in self.pending]
+    self.pending = []
+    return done
+
+  def close(self):
+    self.pool.close()
+    self.pool.join()
@@ -57,6 +57,9 @@ def mpBufManCntrl(Qcmd, Qlog, Qinfo, maxRate = 100. , interval = 1000.):
 
   def cmdEnd():
     Qcmd.put('E')
+
+  def cmdNewRun():
+    Qcmd.put('N')
  
   # a simple clock
   def clkLabel(TkLabel):
@@ -109,8 +112,8 @@ def mpBufManCntrl(Qcmd, Qlog, Qinfo, maxRate = 100. , interval = 1000.):
   buttonP = Tk.Button(frame, text='Pause ', fg='blue', command=cmdPause)
   buttonP.grid(row=0, column=1)
 
-  blank3 = Tk.Label(frame, width=7, text="")
-  blank3.grid(row=0, column=0)
+  buttonN = Tk.Button(frame, text='NewRun', fg='blue', command=cmdNewRun)
+  buttonN.grid(row=0, column=0)
 
 #
 # graphics display 
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+'''
+.. module mpRecorder of picoDAQ
+
+   record compressed events to file
+
+   file format (little-endian):
+     file header: b'PDQR', NChannels (uint16), NSamples (uint32),
+                  TSampling (float64)
+     records:     evNr (uint32), evTime (float64), length (uint32),
+                  compressed event (module evtCompress)
+
+   a new file is started for each new run (see BufferMan.rollover()),
+   named with suffix '_run<n>'; after changes of channel ranges 
+   (BufferMan.reconfigure()) events are recorded with the new scales
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys, os, struct
+
+from .evtCompress import *
+
+FHDR = struct.Struct(str('<4sHId'))
+REC = struct.Struct(str('<IdI'))
+
+def mpRecorder(BM, cId, fileName, NWorkers=2, **kwargs):
+  '''record events of obligatory client cId, runs as sub-process
+
+     Args:
+       BM:       Buffer Manager instance
+       cId:      client id from BM.BMregister()
+       fileName: output file
+       NWorkers: number of compression worker processes
+       kwargs:   options for compressEvent()
+  '''
+  DevConf = BM.DevConf
+
+  def openFile(name):
+    try:
+      f = open(name, 'wb')
+    except Exception as e:
+      print('!=! mpRecorder: cannot open file ' + name + ': ' + str(e))
+      sys.exit(1)
+    f.write(FHDR.pack(b'PDQR', DevConf.NChannels, DevConf.NSamples,
+                      DevConf.TSampling) )
+    return f
+
+  def write(records):
+    for evNr, evTime, blob in records:
+      out[0].write(REC.pack(int(evNr), evTime, len(blob)) + blob)
+      counts[0] += 1
+      counts[1] += len(blob)
+
+  def newRun(run, firstEvNr):
+    # pending events belong to previous run
+    write(C.flush())
+    out[0].close()
+    base, ext = os.path.splitext(fileName)
+    out[0] = openFile(base + '_run%i' % run + ext)
+
+  out = [openFile(fileName)] # current file, replaced by newRun()
+  counts = [0, 0] # records, bytes
+  C = EvtCompressor(scalesFromRanges(DevConf.CRanges), NWorkers, **kwargs)
+  def setScales(version, firstEvNr, CRanges):
+    C.scales = scalesFromRanges(CRanges)
+
+  client = BM.BMgetClient(cId)
+  client.onRunChange(newRun)
+  client.onConfigChange(setScales)
+  try:
+    while BM.ACTIVE.value:
+    # copy of event data, pickled to workers in the background
+      e = BM.getEvent(cId, mode=2)
+      if e is None: break
+      write(C.submit(e[0], e[1], e[2]))
+  except Exception as e:
+    print('!=! mpRecorder: ' + str(e))
+  write(C.flush())
+  C.close()
+  out[0].close()
+  Nrec, Nbytes = counts
+  if Nrec:
+    print('*==* mpRecorder: %i events, %.1f kB/event, compression factor %.1f'
+          % (Nrec, Nbytes / Nrec / 1000.,
+             4. * Nrec * DevConf.NChannels * DevConf.NSamples / Nbytes) )
+  sys.exit()
+
+def readRecords(fileName):
+  '''read events written by mpRecorder
+
+     Yields: evNr, evTime, evData
+  '''
+  with open(fileName, 'rb') as f:
+    tag, NChannels, NSamples, TSampling = FHDR.unpack(f.read(FHDR.size))
+    if tag != b'PDQR':
+      print('!=! readRecords: ' + fileName + ' is not a picoDAQ record file')
+      return
+    while True:
+      h = f.read(REC.size)
+      if len(h) < REC.size: return
+      evNr, evTime, n = REC.unpack(h)
+      blob = f.read(n)
+      if len(blob) < n: return # truncated last record
+      yield evNr, evTime, decompressEvent(blob)
+
+def readBlocks(fileName, N=100):
+  '''read events in blocks, for vectorized offline analysis
+
+     Yields: evNrs (N), evTimes (N), evData (N, NChannels, NSamples);
+             the last block may be shorter
+  '''
+  evNrs, evTimes, evData = [], [], []
+  for n, t, d in readRecords(fileName):
+    evNrs.append(n)
+    evTimes.append(t)
+    evData.append(d)
+    if len(evNrs) == N:
+      yield np.array(evNrs), np.array(evTimes), np.array(evData)
+      evNrs, evTimes, evData = [], [], []
+  if len(evNrs):
+    yield np.array(evNrs), np.array(evTimes), np.array(evData)
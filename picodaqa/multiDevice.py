@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+'''
+.. module multiDevice of picoDAQ
+
+   combine several devices into one logical device for BufferMan
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys, time, threading
+if sys.version_info[0] < 3:
+  import Queue as queue
+else:
+  import queue
+
+class MultiDevConf(object):
+  '''several devices feeding one BufferMan
+
+     each device is read out by its own producer thread into a
+     sub-ring of buffers; acquireData() merges events from all
+     devices, aligned by time stamp or by trigger count within
+     a tolerance, into one event with the channels of all devices;
+     trigger counts are checked against the time stamps and are
+     re-synchronised after a trigger missed by one of the devices
+
+     provides the attributes of PSconfig used by BufferMan and
+     the display modules
+  '''
+
+  def __init__(self, devConfs, align='time', tolerance=1E-3, NSubBuffers=8,
+               resyncTime=1E-3):
+    '''Args:
+         devConfs:    list of initialized (or probed) device configurations
+         align:       'time' (time stamps) or 'trigger' (trigger count)
+         tolerance:   maximum time difference (s) or count difference
+         NSubBuffers: number of buffers per device
+         resyncTime:  maximum time difference (s) of events with equal
+                      trigger count, None: no check
+    '''
+    self.devConfs = devConfs
+    self.NDevices = len(devConfs)
+    self.align = align
+    self.tolerance = tolerance
+    self.resyncTime = resyncTime
+    self.NSubBuffers = NSubBuffers
+
+    dev0 = devConfs[0]
+    for d in devConfs:
+      if d.NSamples != dev0.NSamples or d.TSampling != dev0.TSampling:
+        print('!=! MultiDevConf: all devices need identical sampling')
+        sys.exit(1)
+    self.PSmodel = 'multi'
+    self.NSamples = dev0.NSamples
+    self.TSampling = dev0.TSampling
+    self.pretrig = dev0.pretrig
+    self.trgChan = dev0.trgChan
+    self.trgThr = dev0.trgThr
+    self.trgTyp = dev0.trgTyp
+    self.trgActive = dev0.trgActive
+  # channels of device i > 0 are prefixed with device number
+    self.picoChannels = []
+    self.CRanges = []
+    self.ChanOffsets = []
+    self.devChannels = [] # slice of channels for each device
+    ic = 0
+    for i, d in enumerate(devConfs):
+      pfx = str(i) if i else ''
+      self.picoChannels += [pfx + C for C in d.picoChannels]
+      self.CRanges += list(d.CRanges)
+      self.ChanOffsets += list(d.ChanOffsets)
+      self.devChannels.append(slice(ic, ic + d.NChannels))
+      ic += d.NChannels
+    self.NChannels = ic
+    self.ChanColors = [dev0.ChanColors[i % len(dev0.ChanColors)]
+                       for i in range(self.NChannels)]
+
+  # sub-rings: buffer space, queues of free and of filled buffers
+    self.subBufs = [np.empty( (NSubBuffers, d.NChannels, self.NSamples),
+                    dtype=np.float32) for d in devConfs]
+    self.freeQues = []
+    self.readyQues = []
+    for i in range(self.NDevices):
+      self.freeQues.append(queue.Queue())
+      for j in range(NSubBuffers):
+        self.freeQues[i].put(j)
+      self.readyQues.append(queue.Queue())
+    self.heads = [None for i in range(self.NDevices)]
+    self.Nunmatched = [0 for i in range(self.NDevices)] # dropped events
+    self.countOffset = [0 for i in range(self.NDevices)] # missed triggers
+    self.BM = None
+    self.thrds = []
+
+  def init(self):
+    '''initialise all devices, e.g. in the producer process'''
+    for d in self.devConfs:
+      d.init()
+    self.CRanges = []
+    for d in self.devConfs:
+      self.CRanges += list(d.CRanges)
+
+  def setSamplingPars(self, dT, NSamples, CRanges):
+    self.TSampling = dT
+    self.NSamples = NSamples
+    self.CRanges = CRanges
+
+  def getSamplingPars(self):
+    return self.TSampling, self.NSamples, list(self.CRanges)
+
+  def setBufferManagerPointer(self, BM):
+    self.BM = BM
+    for d in self.devConfs:
+      d.setBufferManagerPointer(BM)
+
+  def closeDevice(self):
+    for d in self.devConfs:
+      d.closeDevice()
+
+  def devProducer(self, idev):
+    '''producer thread, reads device idev into its sub-ring'''
+    dev = self.devConfs[idev]
+    ntrig = 0
+    while self.BM.ACTIVE.value:
+      if not self.BM.RUNNING.value:
+        time.sleep(0.01)
+        continue
+      try:
+        ibuf = self.freeQues[idev].get(timeout=0.1)
+      except queue.Empty:
+        continue
+      e = dev.acquireData(self.subBufs[idev][ibuf])
+      if e is None: break
+      if e[0] is None: # stopped waiting for trigger, no event
+        self.freeQues[idev].put(ibuf)
+        continue
+      ntrig += 1
+      self.readyQues[idev].put( (ibuf, e[0], e[1], ntrig) )
+    self.readyQues[idev].put(None) # signal end
+
+  def startProducers(self):
+    '''start producer threads in the process that owns the devices'''
+    for i in range(self.NDevices):
+      thr = threading.Thread(target=self.devProducer, args=(i,) )
+      thr.setName('acquireData_%i' % i)
+      thr.daemon = True
+      thr.start()
+      self.thrds.append(thr)
+
+  def getHead(self, idev):
+    '''next event from sub-ring of device idev, None at end'''
+    while self.heads[idev] is None:
+      try:
+        self.heads[idev] = self.readyQues[idev].get(timeout=0.1)
+      except queue.Empty:
+        if not self.BM.ACTIVE.value: return None
+        continue
+      if self.heads[idev] is None: return None
+    return self.heads[idev]
+
+  def dropHead(self, idev):
+    self.freeQues[idev].put(self.heads[idev][0])
+    self.heads[idev] = None
+
+  def acquireData(self, buffer):
+    '''
+    merge aligned events from all devices into buffer
+
+      Returns:
+        ttrg: time of earliest device trigger
+        tlife: life time, minimum of all devices
+    '''
+    if not len(self.thrds): self.startProducers()
+    while True:
+      heads = []
+      for i in range(self.NDevices):
+        h = self.getHead(i)
+        if h is None: return None
+        heads.append(h)
+      times = [h[1] for h in heads]
+      if self.align == 'time':
+        vals = times
+      else: # trigger count, corrected for triggers missed by other devices
+        vals = [h[3] - self.countOffset[i] for i, h in enumerate(heads)]
+      imin = int(np.argmin(vals))
+      if max(vals) - vals[imin] <= self.tolerance:
+        if self.align == 'time' or self.resyncTime is None: break
+        imin = int(np.argmin(times))
+        if max(times) - times[imin] <= self.resyncTime: break
+        # counts out of step: oldest event missed by another device
+        self.countOffset[imin] += 1
+        self.BM.prlog('!=! MultiDevConf: trigger count of device %i'
+                      ' re-synchronised' % imin)
+      self.Nunmatched[imin] += 1  # no partner for oldest event, drop it
+      self.dropHead(imin)
+
+    for i in range(self.NDevices):
+      buffer[self.devChannels[i]] = self.subBufs[i][heads[i][0]]
+      self.dropHead(i)
+    return min(h[1] for h in heads), min(h[2] for h in heads)
@@ -16,6 +16,10 @@ class PSconfig(object):
       self.PSmodel = confdict["PSmodel"]
     else:
       self.PSmodel = '2000a' 
+    if "PSserial" in confdict: 
+      self.PSserial = confdict["PSserial"] # to select one of several devices
+    else:
+      self.PSserial = None
 # -- channels to be used
     if "picoChannels" in confdict: 
       self.picoChannels = confdict["picoChannels"]
@@ -132,7 +136,8 @@ class PSconfig(object):
 # configuration parameters only known after initialisation
     # import libraries relevant to PS model
     exec('from picoscope import ps'+self.PSmodel)
-    exec('self.picoDevice = ps'+self.PSmodel+'.PS'+self.PSmodel+'()')  
+    exec('self.picoDevice = ps'+self.PSmodel+'.PS'+self.PSmodel+
+         '(serialNumber=self.PSserial)')  
 
     self.TSampling = 0.
     self.NSamples = 0.
@@ -150,9 +155,18 @@ class PSconfig(object):
     self.NSamples = NSamples # number of samples
     self.CRanges = CRanges # channel ranges
 
+  def getSamplingPars(self):
+    '''parameters known after initialisation, see setSamplingPars()'''
+    return self.TSampling, self.NSamples, list(self.CRanges)
+
   def setBufferManagerPointer(self, BM):
     self.BM = BM
 
+  def closeDevice(self):
+    '''stop and close connection to device'''
+    self.picoDevice.stop()
+    self.picoDevice.close()
+
   def picoIni(self):
     ''' initialise device controlled by class PSconf '''
     verbose = self.verbose
@@ -217,6 +231,39 @@ class PSconfig(object):
 
 # -- end def picoIni
 
+  def reconfigure(self, changes):
+    '''change trigger or channel settings of initialised device,
+       e.g. between events of a run (see BufferMan.reconfigure())
+
+       Args: 
+         changes: dict of new values of trgChan, trgThr, trgTyp, 
+                  trgDelay, trgTO, trgActive, ChanRanges, ChanModes 
+                  or ChanOffsets
+
+       Returns: channel ranges set by device
+    '''
+    def val(k): # new value, attributes are set only if device accepts it
+      return changes[k] if k in changes else getattr(self, k)
+
+    CRanges = self.CRanges
+    chanChanged = 'ChanRanges' in changes or 'ChanModes' in changes or \
+        'ChanOffsets' in changes
+    if chanChanged:
+      CRanges=[]
+      for i, Chan in enumerate(self.picoChannels):
+        CRanges.append(self.picoDevice.setChannel(Chan, val('ChanModes')[i], 
+                   val('ChanRanges')[i], VOffset=val('ChanOffsets')[i], 
+                   enabled=True, BWLimited=False) )
+    # threshold is converted with range and offset of trigger channel
+    if chanChanged or [k for k in changes if k[:3] == 'trg']:
+      self.picoDevice.setSimpleTrigger(val('trgChan'), val('trgThr'), 
+          val('trgTyp'), val('trgDelay'), val('trgTO'), 
+          enabled=val('trgActive'))
+    for k in changes:
+      setattr(self, k, changes[k])
+    self.CRanges = CRanges
+    return self.CRanges
+
   def acquireData(self, buffer):
     '''
     read data from device
@@ -226,13 +273,17 @@ class PSconfig(object):
         buffer: space to store data
 
       Returns:
-        ttrg: time when device became ready
+        ttrg: time when device became ready, 
+              None if stopped for BufferMan.reconfigure() (no event)
         tlife life time of device
   '''
     self.picoDevice.runBlock(pretrig=self.pretrig) #
     ti=time.time()
     while not self.picoDevice.isReady():
-      if not self.BM.ACTIVE: return
+      if not self.BM.ACTIVE.value: return
+      if self.BM.reconfPending.value: # re-armed after changes
+        self.picoDevice.stop()
+        return None, time.time() - ti
       time.sleep(0.0001)
     # waiting time for occurence of trigger is counted as life time
     ttrg=time.time()
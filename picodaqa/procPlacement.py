@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+.. module procPlacement of picoDAQ
+
+   pin threads and processes to CPU sets and set scheduling priority,
+   check if processes are alive
+
+   (Linux only, silently ignored on platforms without sched_setaffinity)
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import os, errno
+
+def placementConfig(BMdict):
+  '''extract placement settings from Buffer Manager configuration
+
+     recognized keys (all optional):
+       CPUaffinity: {name: [cpu, ...]}
+       niceness:    {name: nice value}
+       RTpriority:  {name: SCHED_FIFO priority (1-99)}
+
+     name is acquireData, manageDataBuffer, the name of any process
+     started by BufferMan or runDAQ, or 'default' for all others
+
+     Returns: dictionary {name: (cpus, nice, rtprio)}
+  '''
+  cpus = BMdict["CPUaffinity"] if "CPUaffinity" in BMdict else {}
+  nice = BMdict["niceness"] if "niceness" in BMdict else {}
+  rtprio = BMdict["RTpriority"] if "RTpriority" in BMdict else {}
+  if cpus is None: cpus = {}
+  if nice is None: nice = {}
+  if rtprio is None: rtprio = {}
+  placement = {}
+  for name in set(cpus) | set(nice) | set(rtprio):
+    placement[name] = (cpus.get(name), nice.get(name), rtprio.get(name))
+  return placement
+
+def setPlacement(cpus=None, nice=None, rtprio=None, pid=0):
+  '''apply CPU set and priority to a process or to the calling thread
+
+     Args:
+       cpus:   list of CPU numbers (None: leave unchanged)
+       nice:   niceness, negative values need privileges
+       rtprio: SCHED_FIFO priority, needs privileges (CAP_SYS_NICE)
+       pid:    process id, 0 for calling thread
+
+     Returns: list of error messages (empty if all settings applied)
+  '''
+  errors = []
+  if cpus is not None:
+    if hasattr(os, 'sched_setaffinity'):
+      try:
+        os.sched_setaffinity(pid, cpus)
+      except (OSError, ValueError) as e:
+        errors.append('affinity %s: %s' % (str(cpus), str(e)) )
+    else:
+      errors.append('affinity not supported on this platform')
+  if nice is not None:
+    try:
+      os.setpriority(os.PRIO_PROCESS, pid, nice)
+    except (OSError, AttributeError) as e:
+      errors.append('nice %i: %s' % (nice, str(e)) )
+  if rtprio is not None:
+    if hasattr(os, 'sched_setscheduler'):
+      try:
+        os.sched_setscheduler(pid, os.SCHED_FIFO, os.sched_param(rtprio))
+      except (OSError, ValueError) as e:
+        errors.append('SCHED_FIFO %i: %s' % (rtprio, str(e)) )
+    else:
+      errors.append('SCHED_FIFO not supported on this platform')
+  return errors
+
+def getPlacement(pid=0):
+  '''effective placement of a process or of the calling thread
+
+     Returns: string describing CPU set, scheduling policy and niceness
+  '''
+  s = ''
+  if hasattr(os, 'sched_getaffinity'):
+    try:
+      s += 'cpus ' + str(sorted(os.sched_getaffinity(pid)))
+    except OSError:
+      s += 'cpus ?'
+  if hasattr(os, 'sched_getscheduler'):
+    try:
+      pol = os.sched_getscheduler(pid)
+      if pol == os.SCHED_FIFO:
+        s += ', SCHED_FIFO prio %i' % os.sched_getparam(pid).sched_priority
+      else:
+        s += ', SCHED_OTHER'
+    except OSError:
+      pass
+  try:
+    s += ', nice %i' % os.getpriority(os.PRIO_PROCESS, pid)
+  except (OSError, AttributeError):
+    pass
+  return s
+
+def processAlive(pid):
+  '''True if process pid exists and has not terminated
+
+     terminated child processes not yet joined by their parent
+     (zombies) are recognized on Linux via /proc
+  '''
+  try:
+    os.kill(pid, 0)
+  except OSError as e:
+    return e.errno == errno.EPERM # exists, but owned by other user
+  try:
+    with open('/proc/%i/stat' % pid) as f:
+      return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+  except (IOError, IndexError):
+    return True
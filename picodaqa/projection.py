@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+.. module projection of picoDAQ
+
+   part of an event a client subscribes to: subset of channels,
+   window of samples around the trigger and decimation;
+   only this part is transferred to the client
+
+   usage:
+
+     p = Projection(channels=['A', 'B'], window=(-20, 80), decimate=2)
+     cId = BM.BMregister(projection=p)  # or BM.BMregister_mpQ(..., p)
+     ...
+     evNr, evTime, evData = BM.getEvent(cId)  # evData: (2, 50)
+     t = p.sampleTimes(PSconf.TSampling)      # time w.r.t. trigger
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys
+
+class Projection(object):
+  '''channel subset, sample window relative to trigger, decimation
+
+     if channels are contiguous, the projection of an event buffer
+     is a view, i.e. no data are copied for clients receiving a
+     pointer to the buffer
+  '''
+
+  def __init__(self, channels=None, window=None, decimate=1):
+    '''Args:
+         channels: list of channel indices or names, None: all
+         window:   (first, last) sample relative to trigger sample,
+                   None: all samples
+         decimate: keep every n-th sample (no averaging)
+    '''
+    self.channels = channels
+    self.window = window
+    self.decimate = max(int(decimate), 1)
+    self.chanIndex = slice(None)
+    self.first = 0
+    self.last = None
+    self.iTrigger = 0
+
+  def bind(self, DevConf):
+    '''resolve channel names and window for device configuration
+
+       Returns: self
+    '''
+    NSamples = DevConf.NSamples
+    self.iTrigger = int(NSamples * DevConf.pretrig)
+    if self.channels is None:
+      idx = list(range(DevConf.NChannels))
+    else:
+      idx = []
+      for c in self.channels:
+        if c in DevConf.picoChannels:
+          c = list(DevConf.picoChannels).index(c)
+        if not isinstance(c, (int, np.integer)) or \
+            not 0 <= c < DevConf.NChannels:
+          print('!=! Projection: invalid channel ' + str(c))
+          sys.exit(1)
+        idx.append(c)
+    if len(idx) and idx == list(range(idx[0], idx[-1] + 1)):
+      self.chanIndex = slice(idx[0], idx[-1] + 1) # view
+    else:
+      self.chanIndex = np.array(idx, dtype=np.int32) # copy
+    if self.window is None:
+      self.first, self.last = 0, NSamples
+    else:
+      self.first = min(max(self.iTrigger + self.window[0], 0), NSamples)
+      self.last = min(max(self.iTrigger + self.window[1], self.first),
+                      NSamples)
+    return self
+
+  def apply(self, evData):
+    '''Returns: projection of event data (NChannels, NSamples)'''
+    return evData[self.chanIndex, self.first:self.last:self.decimate]
+
+  def sampleTimes(self, TSampling):
+    '''Returns: times of projected samples w.r.t. trigger'''
+    return (np.arange(self.first, self.last, self.decimate)
+            - self.iTrigger) * TSampling
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+'''
+.. module reTrigger of picoDAQ
+
+   offline software trigger: rate and efficiency of many thresholds
+   and both edge types, evaluated in one pass over recorded events
+
+     R = ReTrigger(np.linspace(-0.1, 0., 51), window=(0, 60))
+     R.process('picoDAQ_events.dat')          # events from mpRecorder
+     thr, rate, eff = R.curves('Falling')     # rate, eff: (NChannels, K)
+     R.write('retrigger.dat')
+
+   the software trigger is armed at the first sample of the window:
+   a falling edge at threshold thr is seen if this sample is above
+   and any later sample at or below thr, i.e. if min <= thr < start;
+   for all thresholds at once, events are counted from the sorted
+   start values and minima (maxima for rising edges) of each block
+
+   efficiency refers to all recorded events, i.e. only thresholds
+   tighter than the one used for recording are meaningful; the rate
+   is the rate of recorded events (from time stamps) times efficiency
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys
+
+from .mpRecorder import readBlocks
+
+edges = ['Falling', 'Rising']
+
+class ReTrigger(object):
+  '''counts of software triggers for a vector of thresholds'''
+
+  def __init__(self, thresholds, window=None):
+    '''Args:
+         thresholds: trigger thresholds (Volt)
+         window:     (first, last) sample searched for a crossing,
+                     None: all samples
+    '''
+    self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float32))
+    self.window = window
+    self.counts = None # triggers per edge, channel and threshold
+    self.N = 0
+    self.tFirst = None
+    self.tLast = None
+
+  def add(self, evTimes, evData):
+    '''evaluate block of events
+
+       Args:
+         evTimes: time stamps (N)
+         evData:  event data (N, NChannels, NSamples)
+    '''
+    N, NChannels, NSamples = evData.shape
+    if self.counts is None:
+      self.counts = np.zeros( (len(edges), NChannels, len(self.thresholds)),
+                              dtype=np.int64)
+    first, last = (0, NSamples) if self.window is None else self.window
+    d = evData[:, :, first:last]
+    start = np.sort(d[:, :, 0], axis=0)
+    lo = np.sort(d.min(axis=2), axis=0)
+    hi = np.sort(d.max(axis=2), axis=0)
+    thr = self.thresholds
+    for c in range(NChannels):
+      # falling: min <= thr < start, rising: start < thr <= max
+      self.counts[0, c] += np.searchsorted(lo[:, c], thr, 'right') \
+                         - np.searchsorted(start[:, c], thr, 'right')
+      self.counts[1, c] += np.searchsorted(start[:, c], thr, 'left') \
+                         - np.searchsorted(hi[:, c], thr, 'left')
+    if self.tFirst is None: self.tFirst = evTimes[0]
+    self.tLast = evTimes[-1]
+    self.N += N
+
+  def process(self, fileName, blockSize=1000):
+    '''evaluate all events recorded by mpRecorder in fileName'''
+    for evNrs, evTimes, evData in readBlocks(fileName, blockSize):
+      self.add(evTimes, evData)
+    return self
+
+  def curves(self, edge='Falling'):
+    '''Returns: thresholds (K), rate (Hz) and efficiency (NChannels, K)'''
+    if edge not in edges:
+      print('!=! ReTrigger: invalid edge type ' + str(edge))
+      sys.exit(1)
+    if not self.N:
+      print('!=! ReTrigger: no events')
+      sys.exit(1)
+    eff = self.counts[edges.index(edge)] / self.N
+    T = self.tLast - self.tFirst
+    rate0 = (self.N - 1) / T if T > 0. else 0. # rate of recorded events
+    return self.thresholds, rate0 * eff, eff
+
+  def write(self, fileName):
+    '''write curves as text, one line per threshold'''
+    NChannels = self.counts.shape[1]
+    cols = ['thr']
+    vals = [self.thresholds]
+    for edge in edges:
+      thr, rate, eff = self.curves(edge)
+      for c in range(NChannels):
+        cols += ['eff%s%i' % (edge[0], c), 'rate%s%i' % (edge[0], c)]
+        vals += [eff[c], rate[c]]
+    with open(fileName, 'w') as f:
+      print('# %i events, edge F(alling) or R(ising), channel index'
+            % self.N, file=f)
+      print('# ' + ', '.join(cols), file=f) # header line
+      for row in np.array(vals).T:
+        print(', '.join('%.6g' % v for v in row), file=f)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+'''
+.. module roiExtract of picoDAQ
+
+   regions of interest (ROI): sparse representation of events
+
+   a pipeline stage after the producer finds windows around pulses
+   with a vectorized threshold and publishes them, together with
+   baseline statistics, as a second event stream; consumers that only
+   look at pulses receive a small fraction of the data
+
+   usage (registration before BM.run()):
+
+     roiQ = BM.BMregister_roiQ()
+     ...
+     sev = roiQ.get()   # SparseEvent, None at end of run
+     for chan, start, wf in sev.segments(): ...
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys
+if sys.version_info[0] < 3:
+  import Queue as queue
+else:
+  import queue
+
+from .evtCompress import findWindows
+
+class SparseEvent(object):
+  '''pulse windows and baseline statistics of an event'''
+
+  def __init__(self, evNr, evTime, NSamples, baselines, sigmas, wins, data):
+    '''Args:
+         evNr, evTime: event number and time
+         NSamples:     number of samples of full trace
+         baselines:    baseline (mean of pre-trigger samples) per channel
+         sigmas:       standard deviation of baseline per channel
+         wins:         windows (chan, start, len), see evtCompress.WIN
+         data:         samples of all windows, concatenated
+    '''
+    self.evNr = evNr
+    self.evTime = evTime
+    self.NSamples = NSamples
+    self.baselines = baselines
+    self.sigmas = sigmas
+    self.wins = wins
+    self.data = data
+
+  def segments(self):
+    '''Yields: channel, first sample, samples of window'''
+    i = 0
+    for w in self.wins:
+      yield int(w['chan']), int(w['start']), self.data[i:i + w['len']]
+      i += w['len']
+
+  def toTrace(self):
+    '''full trace, samples outside of windows set to baseline'''
+    evData = np.repeat(self.baselines[:, None], self.NSamples, axis=1)
+    for c, s, wf in self.segments():
+      evData[c, s:s + len(wf)] = wf
+    return evData
+
+def extractROI(evNr, evTime, evData, NBaseline, window, threshold=None,
+               Nsigma=5.):
+  '''find regions of interest in an event
+
+     Args:
+       evNr, evTime, evData: event as provided by BufferMan.getEvent()
+       NBaseline: number of samples for baseline (pre-trigger region)
+       window:    (samples before, samples after) around regions
+       threshold: threshold (Volt) w.r.t. baseline, scalar or per channel
+       Nsigma:    threshold in units of baseline sigma, if threshold is None
+
+     Returns: SparseEvent
+  '''
+  pre = evData[:, :max(NBaseline, 2)]
+  baselines = pre.mean(axis=1, dtype=np.float64).astype(np.float32)
+  sigmas = pre.std(axis=1, dtype=np.float64).astype(np.float32)
+  if threshold is None: threshold = Nsigma * sigmas
+  wins = findWindows(evData, baselines, threshold, window)
+  if len(wins):
+    data = np.concatenate([evData[w['chan'], w['start']:w['start'] + w['len']]
+                           for w in wins])
+  else:
+    data = np.zeros(0, dtype=np.float32)
+  return SparseEvent(evNr, evTime, evData.shape[1], baselines, sigmas,
+                     wins, data)
+
+def mpROIExtractor(BM, cId, roiQues, NBaseline, window, threshold=None,
+                   Nsigma=5., mode=0):
+  '''consumer publishing sparse events; runs as sub-process
+
+     Args:
+       BM:      Buffer Manager instance
+       cId:     client id from BM.BMregister()
+       roiQues: list of (multiprocessing Queue, lossless flag)
+       mode:    0: obligatory consumer, needed for lossless subscribers
+                1: random consumer, data acquisition does not wait
+       other:   as for extractROI()
+
+     events are dropped for subscribers with lossless flag False
+     if their Queue is full
+  '''
+  Nev = 0
+  Ndropped = [0 for q in roiQues]
+  Nbytes = 0
+  try:
+    while BM.ACTIVE.value:
+      # mode 0: pointer to buffer, windows are copied by extractROI
+      e = BM.getEvent(cId, mode=mode)
+      if e is None: break
+      sev = extractROI(int(e[0]), e[1], e[2], NBaseline, window,
+                       threshold, Nsigma)
+      Nev += 1
+      Nbytes += sev.data.nbytes
+      for i, (Q, lossless) in enumerate(roiQues):
+        if lossless: # wait for subscriber, but not beyond end of run
+          while BM.ACTIVE.value:
+            try:
+              Q.put(sev, timeout=0.1)
+              break
+            except queue.Full:
+              pass
+        else:
+          try:
+            Q.put_nowait(sev)
+          except queue.Full:
+            Ndropped[i] += 1
+  except Exception as e:
+    print('!=! mpROIExtractor: ' + str(e))
+  for Q, lossless in roiQues:
+    try:
+      Q.put_nowait(None) # signal end of run
+    except queue.Full:
+      pass
+  if Nev:
+    print('*==* mpROIExtractor: %i events, %.1f%% of samples in windows,'
+          % (Nev, 100. * Nbytes / Nev / BM.BMbuf[0].nbytes),
+          'dropped:', Ndropped)
+  sys.exit()
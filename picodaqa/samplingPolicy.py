@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+.. module samplingPolicy of picoDAQ
+
+   decide which random consumers receive a copy of the current event
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+class TokenBucket(object):
+  '''pace deliveries to a target rate, allowing for small bursts'''
+
+  def __init__(self, rate, burst=1.):
+    '''Args:
+         rate:  target rate in Hz
+         burst: maximum number of tokens accumulated
+    '''
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.tlast = None
+
+  def available(self, t, scale=1.):
+    '''refill bucket at time t, refill rate scaled by factor scale
+
+       Returns: True if a token is available
+    '''
+    if self.tlast is not None:
+      self.tokens = min(self.burst,
+                        self.tokens + (t - self.tlast) * self.rate * scale)
+    self.tlast = t
+    return self.tokens >= 1.
+
+  def take(self):
+    '''consume a token'''
+    self.tokens -= 1.
+
+class RandomSampler(object):
+  '''sampling policy for random consumers
+
+     - each consumer may have a target rate (token bucket pacing)
+     - above the low watermark of the buffer filling level, rates
+       are scaled down by the backoff factor; consumers without
+       a target rate are still served
+     - above the high watermark, no events are delivered until
+       the filling level falls below the low watermark again
+  '''
+
+  def __init__(self, lowWatermark=0.25, highWatermark=0.5, backoff=0.25):
+    '''Args:
+         lowWatermark:  buffer filling fraction to start backoff
+         highWatermark: buffer filling fraction to stop delivery
+         backoff:       rate scale factor between watermarks
+    '''
+    self.lowWatermark = lowWatermark
+    self.highWatermark = highWatermark
+    self.backoff = backoff
+    self.buckets = []
+    self.suspended = False
+
+  def add(self, rate=None):
+    '''add a consumer with target rate (None: as often as possible)'''
+    if rate:
+      self.buckets.append(TokenBucket(rate))
+    else:
+      self.buckets.append(None)
+
+  def select(self, fill, t, isReady):
+    '''select consumers to receive the current event
+
+       Args:
+         fill:    filling level of buffer (fraction)
+         t:       current time
+         isReady: function(index), True if consumer can receive an event;
+                  only called for consumers due for an event
+
+       Returns: list of consumer indices
+    '''
+    if self.suspended:
+      if fill >= self.lowWatermark: return []
+      self.suspended = False
+    elif fill > self.highWatermark:
+      self.suspended = True
+      return []
+    scale = self.backoff if fill > self.lowWatermark else 1.
+    selected = []
+    for i, bucket in enumerate(self.buckets):
+      if bucket is None:
+        if isReady(i): selected.append(i)
+      elif bucket.available(t, scale) and isReady(i):
+        bucket.take()
+        selected.append(i)
+    return selected
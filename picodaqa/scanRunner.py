@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+.. module scanRunner of picoDAQ
+
+   scans of device and analysis parameters, e.g. trigger threshold
+   and height of the reference pulse, with statistics for each point
+
+     S = ScanRunner([('trgThr', [-0.02, -0.03, -0.04]),
+                     ('pulseHeight', [-0.030, -0.035])],
+                    analysis=makeProcessor,
+                    counters=['validCount', 'coincidenceCount'],
+                    NEvents=500, duration=60.)
+     S.run(BM, cId)               # real or simulated device
+       # or S.runOffline('picoDAQ_events.dat') - events from mpRecorder
+     S.write('scan.dat')
+
+   device parameters (see BufferMan.reconfigKeys) are set via the
+   command Queue of the Buffer Manager, i.e. the scan may run in a
+   sub-process; other parameters are passed to analysis(point), which
+   returns an object with a method process(event) and the counters as
+   attributes, e.g. a PulseProcessor for the parameters of the point
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, sys, time, itertools
+
+from .BufferMan import reconfigKeys
+from .mpRecorder import readRecords
+
+def scanPoints(grid):
+  '''all combinations of parameter values, first parameter varies slowest
+
+     Args: grid: list of (name, list of values) or dict
+
+     Returns: list of dicts {name: value}
+  '''
+  if isinstance(grid, dict): grid = list(grid.items())
+  names = [g[0] for g in grid]
+  return [dict(zip(names, vals)) for vals in
+          itertools.product(*[g[1] for g in grid])]
+
+class ScanRunner(object):
+  '''step through a grid of parameters, record rates, life time,
+     analysed events and counters per point
+  '''
+
+  def __init__(self, grid, analysis=None, counters=(), NEvents=1000,
+               duration=None, timeout=10.):
+    '''Args:
+         grid:     list of (name, list of values) or dict, see scanPoints()
+         analysis: function of point, returns object with process(event)
+                   and counters, None: events are only counted
+         counters: attributes of analysis object, increments recorded
+         NEvents:  events per point, None: no limit
+         duration: time (s) per point, None: no limit
+         timeout:  maximum time (s) to set device parameters
+    '''
+    if NEvents is None and duration is None:
+      print('!=! ScanRunner: NEvents or duration needed')
+      sys.exit(1)
+    self.names = [g[0] for g in (grid.items() if isinstance(grid, dict)
+                                 else grid)]
+    self.points = scanPoints(grid)
+    self.analysis = analysis
+    self.counters = list(counters)
+    self.NEvents = np.inf if NEvents is None else NEvents
+    self.duration = np.inf if duration is None else duration
+    self.timeout = timeout
+    self.results = [] # one dict per point
+
+  def counts(self, a):
+    return np.array([getattr(a, n) for n in self.counters], dtype=float)
+
+  def run(self, BM, client_index, mode=0):
+    '''scan with data from Buffer Manager; the client is unregistered
+       at the end, i.e. data acquisition continues without it
+
+       Args:
+         BM:           Buffer Manager instance
+         client_index: client id from BM.BMregister()
+         mode:         request mode of getEvent()
+
+       Returns: results, see table()
+    '''
+    c = BM.BMgetClient(client_index)
+    for point in self.points:
+      dev = dict((k, point[k]) for k in point if k in reconfigKeys)
+      t0 = time.time()
+      if len(dev): # new configuration version, starting with event first
+        v = BM.confVersion.value
+        BM.BMCommandQue.put( ('C', dev) )
+        while BM.confVersion.value == v and BM.ACTIVE.value:
+          if time.time() - t0 > self.timeout:
+            BM.prlog('!=! ScanRunner: device not configured: ' + str(dev))
+            c.unregister()
+            return self.table()
+          c.getEvent(mode=mode, timeout=0.001) # previous settings, skipped
+        v = BM.confVersion.value
+        first = int(BM.confTable[v % len(BM.confTable), 1])
+      else:
+        first = BM.Ntrig.value + 1
+      Tset = time.time() - t0
+      a = None if self.analysis is None else self.analysis(point)
+      c0 = self.counts(a)
+      Tlife0 = BM.Tlife.value
+      n = 0
+      t1 = time.time()
+      while n < self.NEvents and time.time() - t1 < self.duration:
+        e = c.getEvent(mode=mode, timeout=0.1)
+        if e is None:
+          if not BM.ACTIVE.value: break
+          continue
+        if e[0] < first: continue # previous settings
+        if a is not None: a.process(e)
+        n += 1
+      T = time.time() - t1
+      Ntrig = BM.Ntrig.value - first + 1
+      Tlife = BM.Tlife.value - Tlife0
+      self.record(point, n, Ntrig, T, Tset,
+                  Ntrig / Tlife if Tlife > 0. else 0.,
+                  100. * Tlife / T, self.counts(a) - c0)
+      BM.prlog('*==* ScanRunner: %s  %i events  rate %.3gHz'
+               % (str(point), n, self.results[-1]['rate']) )
+      if not BM.ACTIVE.value: break
+    c.unregister()
+    return self.table()
+
+  def runOffline(self, fileName):
+    '''scan of analysis parameters with events recorded by mpRecorder;
+       rate from time stamps of events, life time not known
+
+       Returns: results, see table()
+    '''
+    dev = [k for k in self.names if k in reconfigKeys]
+    if len(dev):
+      print('!=! ScanRunner: device parameters ' + str(dev) +
+            ' not possible offline')
+      sys.exit(1)
+    for point in self.points:
+      a = None if self.analysis is None else self.analysis(point)
+      c0 = self.counts(a)
+      n = 0
+      t0 = time.time()
+      for e in readRecords(fileName):
+        if n >= self.NEvents or time.time() - t0 > self.duration: break
+        if a is not None: a.process(e)
+        if n == 0: tFirst = e[1]
+        tLast = e[1]
+        n += 1
+      self.record(point, n, n, time.time() - t0, 0.,
+                  (n - 1) / (tLast - tFirst) if n > 1 else 0.,
+                  np.nan, self.counts(a) - c0)
+    return self.table()
+
+  def record(self, point, n, Ntrig, T, Tset, rate, lifefrac, counts):
+    r = dict(point)
+    r.update({'Nev': n, 'Ntrig': Ntrig, 'T': T, 'Tset': Tset,
+              'rate': rate, 'lifefrac': lifefrac})
+    r.update(zip(self.counters, counts))
+    self.results.append(r)
+
+  def columns(self):
+    return self.names + ['Nev', 'Ntrig', 'T', 'Tset', 'rate',
+                         'lifefrac'] + self.counters
+
+  def table(self):
+    '''Returns: results as numpy structured array, one row per point:
+                parameters, analysed events, events from device,
+                time (s), time to set parameters (s), rate (Hz, life
+                time corrected online), life fraction (%), counters
+    '''
+    cols = self.columns()
+    return np.array([tuple(r[k] for k in cols) for r in self.results],
+                    dtype=[(str(k), 'f8') for k in cols])
+
+  def write(self, fileName):
+    '''write results as text, one line per point'''
+    with open(fileName, 'w') as f:
+      print('# ' + ', '.join(self.columns()), file=f) # header line
+      for r in self.results:
+        print(', '.join('%.6g' % r[k] for k in self.columns()), file=f)
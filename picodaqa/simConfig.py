@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+'''
+.. module simConfig of picoDAQ
+
+   simulated device with the interface of class PSconfig,
+   for tests of BufferMan and consumers without hardware
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, time, threading
+
+class SimTrigger(object):
+  '''common source of physics events for several simulated devices
+
+     every device sees the same sequence of event times and pulse
+     amplitudes; call next(idev) to obtain time and amplitude (in units 
+     of the mean pulse height) of the next event for device idev
+  '''
+
+  def __init__(self, rate=100., NDevices=1):
+    self.rate = rate
+    self.t = time.time()
+    self.lock = threading.Lock()
+    self.pending = [[] for i in range(NDevices)]
+
+  def next(self, idev):
+    self.lock.acquire()
+    if not len(self.pending[idev]):
+      self.t = max(self.t, time.time()) + np.random.exponential(1./self.rate)
+      a = np.random.exponential(1.)
+      for p in self.pending:
+        p.append( (self.t, a) )
+    t, a = self.pending[idev].pop(0)
+    self.lock.release()
+    return t, a
+
+class SIMconfig(object):
+  '''simulated oscilloscope: noise and pulses of exponential shape'''
+
+  def __init__(self, confdict=None, simTrigger=None, idev=0):
+    '''Args:
+         confdict:   configuration dictionary (keys as for PSconfig)
+         simTrigger: SimTrigger instance shared by several devices
+         idev:       index of device for simTrigger
+    '''
+    if confdict==None: confdict={}
+    self.PSmodel = 'sim'
+    if "picoChannels" in confdict:
+      self.picoChannels = confdict["picoChannels"]
+    else:
+      self.picoChannels = ['A', 'B'] # channels
+    self.NChannels = len(self.picoChannels)
+    if "ChanRanges" in confdict:
+      self.ChanRanges = confdict["ChanRanges"]
+    else:
+      self.ChanRanges=[0.2 for i in range(self.NChannels)]
+    if "Nsamples" in confdict:
+      self.Nsamples = confdict["Nsamples"]
+    else:
+      self.Nsamples = 200  # number of samples to take
+    if "sampleTime" in confdict:
+      self.sampleTime = confdict["sampleTime"]
+    else:
+      self.sampleTime = 10.E-6 # duration of sample
+    if "trgChan" in confdict:
+      self.trgChan = confdict["trgChan"]
+    else:
+      self.trgChan = self.picoChannels[0] # trigger channel
+    if "trgThr" in confdict:
+      self.trgThr = confdict["trgThr"]
+    else:
+      self.trgThr = -0.04   #  threshold
+    if "trgTyp" in confdict:
+      self.trgTyp = confdict["trgTyp"]
+    else:
+      self.trgTyp = 'Falling'  #  type
+    if "trgActive" in confdict:
+      self.trgActive=confdict["trgActive"]
+    else:
+      self.trgActive = True
+    if "pretrig" in confdict:
+      self.pretrig=confdict["pretrig"]
+    else:
+      self.pretrig=0.05      # fraction of samples before trigger
+    if "ChanOffsets" in confdict:
+      self.ChanOffsets = confdict['ChanOffsets']
+    else:
+      self.ChanOffsets= [0. for i in range(self.NChannels)]
+    if "ChanColors" in confdict:
+      self.ChanColors=confdict["ChanColors"]
+    else:
+      self.ChanColors = ['darkblue', 'darkslategrey', 'darkred', 'darkgreen']
+    if "verbose" in confdict:
+      self.verbose = confdict["verbose"]
+    else:
+      self.verbose=1
+# parameters of simulation
+    if "simRate" in confdict:
+      self.simRate = confdict["simRate"]
+    else:
+      self.simRate = 100.  # rate of physics events in Hz
+    if "simNoise" in confdict:
+      self.simNoise = confdict["simNoise"]
+    else:
+      self.simNoise = 0.002   # noise level in V
+    if "simPulseHeight" in confdict:
+      self.simPulseHeight = confdict["simPulseHeight"]
+    else:
+      self.simPulseHeight = -0.08 # mean pulse height in V
+    if "simTau" in confdict:
+      self.simTau = confdict["simTau"]
+    else:
+      self.simTau = 40E-9 # decay time of pulses
+    if "simJitter" in confdict:
+      self.simJitter = confdict["simJitter"]
+    else:
+      self.simJitter = 20E-6 # jitter of time stamps w.r.t. simTrigger
+    if "simMissProb" in confdict:
+      self.simMissProb = confdict["simMissProb"]
+    else:
+      self.simMissProb = 0.  # probability to miss an event of simTrigger
+
+    if simTrigger is None: simTrigger = SimTrigger(self.simRate)
+    self.simTrigger = simTrigger
+    self.idev = idev
+    self.BM = None
+# - end SIMconfig.__init__()
+
+  def init(self):
+    # same attributes as PSconfig after initialisation
+    self.TSampling = self.sampleTime/self.Nsamples
+    self.NSamples = self.Nsamples
+    self.CRanges = list(self.ChanRanges)
+    self.toverhead = 0.
+    if self.verbose > 0:
+      print(6*' '+'SIMconfig: %i channels, %i samples, rate %.3gHz'\
+            %(self.NChannels, self.NSamples, self.simRate) )
+
+  def setSamplingPars(self, dT, NSamples, CRanges):
+    self.TSampling = dT
+    self.NSamples = NSamples
+    self.CRanges = CRanges
+
+  def getSamplingPars(self):
+    return self.TSampling, self.NSamples, list(self.CRanges)
+
+  def reconfigure(self, changes):
+    '''change trigger or channel settings, as PSconfig.reconfigure()'''
+    if 'ChanRanges' in changes: 
+      CRanges = list(changes['ChanRanges'])
+    else:
+      CRanges = list(self.ChanRanges)
+    for k in changes:
+      setattr(self, k, changes[k])
+    self.CRanges = CRanges
+    return self.CRanges
+
+  def setBufferManagerPointer(self, BM):
+    self.BM = BM
+
+  def closeDevice(self):
+    pass
+
+  def pulse(self, height):
+    '''pulse shape, starting at trigger position'''
+    i0 = int(self.NSamples * self.pretrig)
+    t = np.arange(self.NSamples - i0) * self.TSampling
+    p = np.zeros(self.NSamples, dtype=np.float32)
+    p[i0:] = height * np.exp(-t/self.simTau)
+    return p
+
+  def acquireData(self, buffer):
+    '''
+    simulate data taking, interface as PSconfig.acquireData()
+
+      Returns:
+        ttrg: time when device became ready,
+              None if stopped for BufferMan.reconfigure() (no event)
+        tlife life time of device
+    '''
+    ti = time.time()
+    while True:
+      t, a = self.simTrigger.next(self.idev)
+      # events arrive in real time, also those not triggering
+      while time.time() < t:
+        if self.BM is not None:
+          if not self.BM.ACTIVE.value: return
+          if self.BM.reconfPending.value: return None, time.time() - ti
+        time.sleep(min(0.01, max(0., t - time.time())) )
+      h = a * self.simPulseHeight # same amplitude for all devices
+      if np.random.uniform() < self.simMissProb: continue
+      # software trigger on simulated pulse height
+      if not self.trgActive: break
+      if self.trgTyp == 'Rising' and h >= self.trgThr: break
+      if self.trgTyp != 'Rising' and h <= self.trgThr: break
+    ttrg = t + np.random.uniform(0., self.simJitter)
+    buffer[:] = np.random.normal(0., self.simNoise,
+                                 (self.NChannels, self.NSamples) )
+    p = self.pulse(h)
+    for i in range(self.NChannels):
+      buffer[i] += p * np.random.uniform(0.5, 1.)
+    return ttrg, max(0., t - ti) # waiting time for trigger is life time
+# - end SIMconfig
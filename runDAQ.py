@@ -45,6 +45,9 @@ import traceback as trace
 # import relevant pieces from picodaqa
 import picodaqa.picoConfig
 import picodaqa.BufferMan as BMan
+from picodaqa.simConfig import SIMconfig, SimTrigger
+from picodaqa.multiDevice import MultiDevConf
+from picodaqa.projection import Projection
 
 # animated displays running as background processes/threads
 from picodaqa.mpOsci import mpOsci
@@ -69,25 +72,31 @@ def kbdin():
   # keyboard input as thread
   global kbdtxt
   while True:
-    kbdtxt = input(30*' '+'type -> E(nd), P(ause), S(top) or R(esume) + <ret> ')
+    kbdtxt = input(20*' '+
+          'type -> E(nd), P(ause), S(top), R(esume) or N(ew run) + <ret> ')
 
 def closeDevice():
   '''
     Close down hardwre device at end of run
   '''
+  if BM.ProducerMode == 'process':
+    return # device owned and closed by producer process
   if verbose: print('  closing connection to device')
-  PSconf.picoDevice.stop()
-  PSconf.picoDevice.close()
-  time.sleep(1)
+  PSconf.closeDevice()
 
-def stop_processes(proclst):
+def stop_processes(proclst, timeout=2.):
   '''
-    Close Device at end of run
+    End sub-processes at end of run: wait until processes
+    observing BM.ACTIVE ended, terminate others
   '''
-  for p in proclst: # stop all sub-processes
-    print('    terminating '+p.name)
-    p.terminate()
-  time.sleep(2)
+  tend = time.time() + timeout
+  for p in proclst:
+    p.join(max(tend - time.time(), 0.) )
+  for p in proclst: # stop remaining sub-processes
+    if p.is_alive():
+      print('    terminating '+p.name)
+      p.terminate()
+      p.join(1.)
 
 
 if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
@@ -132,15 +141,28 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
     verbose = DAQconfdict["verbose"]
   else:
     verbose = 1   # print (detailed) info if >0 
+  # several devices: alignment of events 
+  if "DeviceAlign" in DAQconfdict: 
+    DeviceAlign = DAQconfdict["DeviceAlign"] # 'time' or 'trigger'
+  else:
+    DeviceAlign = 'time'
+  if "DeviceTolerance" in DAQconfdict: 
+    DeviceTolerance = DAQconfdict["DeviceTolerance"] 
+  else:
+    DeviceTolerance = 1E-3 if DeviceAlign == 'time' else 0
     
-  # read scope configuration file
-  print('    Device configuration from file ' + DeviceFile)
-  try:
-    with open(DeviceFile) as f:
-      PSconfdict=yaml.load(f)
-  except:
-    print('     failed to read scope configuration file ' + DeviceFile)
-    exit(1)
+  # read scope configuration file(s)
+  if type(DeviceFile) != list:
+    DeviceFile = [DeviceFile]
+  PSconfdicts = []
+  for fnam in DeviceFile:
+    print('    Device configuration from file ' + fnam)
+    try:
+      with open(fnam) as f:
+        PSconfdicts.append(yaml.load(f))
+    except:
+      print('     failed to read scope configuration file ' + fnam)
+      exit(1)
 
   # read Buffer Manager configuration file
   try:
@@ -155,8 +177,27 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
 
 # configure and initialize PicoScope
   try:
-    PSconf=picodaqa.picoConfig.PSconfig(PSconfdict)
-    PSconf.init()
+    # producer process opens the device, only its configuration used here
+    probe = "ProducerMode" in BMconfdict and \
+             BMconfdict["ProducerMode"] == 'process'
+    devConfs = []
+    simTrg = None # common trigger source for simulated devices 
+    for i, PSconfdict in enumerate(PSconfdicts):
+      if "PSmodel" in PSconfdict and PSconfdict["PSmodel"] == 'sim':
+        if simTrg is None: 
+          simTrg = SimTrigger(PSconfdict.get("simRate", 100.), 
+                              len(PSconfdicts) )
+        devConfs.append(SIMconfig(PSconfdict, simTrg, i))
+      else:
+        devConfs.append(picodaqa.picoConfig.PSconfig(PSconfdict))
+      if probe:
+        BMan.probeDevice(devConfs[-1])
+      else:
+        devConfs[-1].init()
+    if len(devConfs) == 1:
+      PSconf = devConfs[0]
+    else: # several devices combined into one logical device
+      PSconf = MultiDevConf(devConfs, DeviceAlign, DeviceTolerance)
   except:
     trace.print_exc()
     exit(1)
@@ -192,14 +233,17 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
     
   # rate display
   if 'mpRMeter' in modules:
-    RMcidx, RMmpQ = BM.BMregister_mpQ()
-    procs.append(mp.Process(name='RMeter', target = mpRMeter, 
+    RMcidx, RMmpQ = BM.BMregister_mpQ('RMeter', 
+                      projection=Projection(channels=[]) ) # no samples
+    procs.append(BMan.ConsumerProcess(name='RMeter', target = mpRMeter, 
               args=(RMmpQ, 75., 2500., 'trigger rate history') ) )
 #                       maxRate interval name
   # Voltmeter display
   if 'mpVMeter' in modules:
-    VMcidx, VMmpQ = BM.BMregister_mpQ()
-    procs.append(mp.Process(name='VMeter', target = mpVMeter, 
+    VMcidx, VMmpQ = BM.BMregister_mpQ('VMeter', 
+             projection=Projection(channels=PSconf.picoChannels[:2]) )
+                      # displays 2 channels only
+    procs.append(BMan.ConsumerProcess(name='VMeter', target = mpVMeter, 
               args=(VMmpQ, PSconf, 500., 'effective Voltage') ) )
 #                         config interval name
 
@@ -221,14 +265,15 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
 # start all background processes   
   for prc in procs:
     prc.deamon = True
+    if BM.RestartConsumers: BM.watchProcess(prc) # restart if process dies
     prc.start()
     print(' -> starting process ', prc.name, ' PID=', prc.pid)
-  time.sleep(1.)
+    BM.placeProcess(prc.name, prc.pid)
 # start threads
   for thrd in thrds:
     thrd.daemon = True
     thrd.start()
-  time.sleep(1.) # wait for all threads to start, then ...
+  BM.BMwaitClients() # wait for all clients to request data, then ...
 # ...start run
   BM.run() 
 
@@ -250,6 +295,8 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
           BM.resume()
         elif cmd == 'S': 
           BM.stop()
+        elif cmd == 'N': 
+          BM.rollover()
         elif cmd =='E': 
           BM.end()
           continue  # while
@@ -17,8 +17,8 @@ from examples.pulseFilterd import *
 cId_pf = BM.BMregister()
 procs.append(mp.Process(name='pulseFilter', target=pulseFilterd, args=(BM,PSconf, cId_pf), kwargs={'fileout':True, 'verbose':2}))
 
-cId_pp = BM.BMregister()
-procs.append(mp.Process(name='ProcessPulse', target = mpProcessPulse,args=(BM, PSconf, cId_pp)))
+cId_pp = BM.BMregister(evFilter=coincidenceFilter)
+procs.append(mp.Process(name='ProcessPulse', target = mpProcessPulse,args=(BM.BMgetClient(cId_pp), PSconf, cId_pp)))
 
 # get Client Id from BufferManager (must be done in mother process)
 #cId_o = BM.BMregister() 